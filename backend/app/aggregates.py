@@ -0,0 +1,141 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import Integer, Numeric, Table, func, select
+
+# Files whose aggregate results are kept; the least recently used file is dropped first
+AGGREGATE_CACHE_FILES = int(os.getenv("AGGREGATE_CACHE_FILES", "64"))
+
+# Different group-by/measure combinations cached per file
+AGGREGATE_CACHE_QUERIES = 32
+
+# Keep GROUP BY results small enough to return in one response
+MAX_GROUP_BY_COLUMNS = 5
+
+AGGREGATE_FUNCTIONS = {
+    "sum": func.sum,
+    "avg": func.avg,
+    "min": func.min,
+    "max": func.max,
+    "count": func.count,
+}
+
+
+class AggregateSpecError(ValueError):
+    """
+    Raised for unknown columns, non-numeric measures or unknown functions.
+    """
+
+
+# ---------------------------------------
+# Request parsing and query building
+# ---------------------------------------
+
+def parse_aggregate_spec(table: Table, group_by: str, measures: str) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """
+    Parse "Marketing_Airline,Quarter" and "Total_Passengers,ASMs:avg" into
+    group columns and (column, function) measures; the function defaults to sum.
+    """
+    groups = [col.strip() for col in (group_by or "").split(",") if col.strip()]
+    if len(groups) > MAX_GROUP_BY_COLUMNS:
+        raise AggregateSpecError(f"At most {MAX_GROUP_BY_COLUMNS} group_by columns are allowed")
+    unknown = [col for col in groups if col not in table.c]
+    if unknown:
+        raise AggregateSpecError(f"Unknown group_by columns: {', '.join(unknown)}")
+
+    parsed = []
+    for item in (measures or "").split(","):
+        if not item.strip():
+            continue
+        col, _, function = item.strip().partition(":")
+        function = (function or "sum").lower()
+        if function not in AGGREGATE_FUNCTIONS:
+            raise AggregateSpecError(f"Unknown function '{function}', use one of {sorted(AGGREGATE_FUNCTIONS)}")
+        if col not in table.c:
+            raise AggregateSpecError(f"Unknown measure column '{col}'")
+        if function != "count" and not isinstance(table.c[col].type, (Integer, Numeric)):
+            raise AggregateSpecError(f"Measure '{col}' is not numeric")
+        parsed.append((col, function))
+    if not parsed:
+        raise AggregateSpecError("At least one measure is required")
+    return groups, parsed
+
+
+def aggregate_query(table: Table, file_reference: str, groups: List[str], measures: List[Tuple[str, str]]):
+    # One GROUP BY over the file's rows; the (File_Reference, id) index narrows it to the file
+    measure_columns = [
+        AGGREGATE_FUNCTIONS[function](table.c[col]).label(f"{col}_{function}") for col, function in measures
+    ]
+    group_columns = [table.c[col] for col in groups]
+    query = (
+        select(*group_columns, func.count().label("row_count"), *measure_columns)
+        .where(table.c.File_Reference == file_reference)
+    )
+    if group_columns:
+        query = query.group_by(*group_columns).order_by(*group_columns)
+    return query
+
+
+# ---------------------------------------
+# Per-file result cache
+# ---------------------------------------
+
+class AggregateCache:
+    """
+    Aggregate results keyed by file_reference, then by (group_by, measures).
+
+    Every entry carries the file's data version (snapshots.file_data_versions)
+    read in the same transaction as its query. A lookup hits only for the
+    version the caller just read, so a write from any process or host, which
+    bumps the version, retires what is cached here. invalidate() also drops a
+    file's entries at once after a write from this process.
+    """
+
+    def __init__(self, max_files: int = AGGREGATE_CACHE_FILES, max_queries: int = AGGREGATE_CACHE_QUERIES):
+        self.max_files = max_files
+        self.max_queries = max_queries
+        # file_reference -> (data version, {key: result})
+        self._files: "OrderedDict[str, Tuple[int, OrderedDict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, file_reference: str, key: tuple, version: int) -> Optional[Any]:
+        with self._lock:
+            cached = self._files.get(file_reference)
+            if cached is None or cached[0] != version or key not in cached[1]:
+                self.misses += 1
+                return None
+            results = cached[1]
+            self._files.move_to_end(file_reference)
+            results.move_to_end(key)
+            self.hits += 1
+            return results[key]
+
+    def put(self, file_reference: str, key: tuple, value: Any, version: int):
+        with self._lock:
+            cached = self._files.get(file_reference)
+            if cached is not None and cached[0] > version:
+                return  # Computed from data a later write has already replaced
+            if cached is None or cached[0] < version:
+                cached = (version, OrderedDict())
+                self._files[file_reference] = cached
+            results = cached[1]
+            self._files.move_to_end(file_reference)
+            results[key] = value
+            if len(results) > self.max_queries:
+                results.popitem(last=False)
+            if len(self._files) > self.max_files:
+                self._files.popitem(last=False)
+
+    def invalidate(self, file_reference: Optional[str] = None):
+        with self._lock:
+            if file_reference is None:
+                self._files.clear()
+            else:
+                self._files.pop(file_reference, None)
+
+
+aggregate_cache = AggregateCache()
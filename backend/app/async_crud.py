@@ -0,0 +1,59 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import aggregates, crud, database, models, snapshots
+from .schema_registry import get_registry
+
+
+# ---------------------------------------
+# Async versions of the hot read queries
+# ---------------------------------------
+
+async def get_uploaded_files(db: AsyncSession):
+    query = select(models.FileUploadLog).order_by(models.FileUploadLog.upload_timestamp.desc())
+    return (await db.execute(query)).scalars().all()
+
+
+async def get_file_by_id(db: AsyncSession, file_id: str):
+    # Looked up by File_Reference, which is what the /files/{file_id} routes receive
+    query = select(models.FileUploadLog).where(models.FileUploadLog.file_reference == file_id).limit(1)
+    return (await db.execute(query)).scalars().first()
+
+
+async def get_file_record_rows(db: AsyncSession, file_reference: str, columns: list = None, after_id: int = None, limit: int = None):
+    result = await db.execute(crud.file_records_query(file_reference, columns, after_id, limit))
+    return list(result.keys()), result.fetchall()
+
+
+async def stream_file_record_rows(db: AsyncSession, file_reference: str, columns: list = None, after_id: int = None,
+                                  chunk_size: int = crud.STREAM_CHUNK_SIZE, limit: int = None):
+    # Server-side cursor read without blocking the event loop between chunks
+    query = crud.file_records_query(file_reference, columns, after_id, limit)
+    result = await db.stream(query.execution_options(yield_per=chunk_size))
+    keys = list(result.keys())
+    async for rows in result.partitions():
+        yield keys, rows
+
+
+async def get_rules(db: AsyncSession):
+    return (await db.execute(select(models.MathRule))).scalars().all()
+
+
+async def get_first_row(db: AsyncSession, columns: list) -> dict:
+    table = await get_registry(database.engine).get_table_async("flight_data")
+    selected = [table.c[col] for col in columns if col in table.c]
+    row = (await db.execute(select(*selected).limit(1))).fetchone()
+    return dict(row._mapping) if row else {}
+
+
+async def get_file_data_version(db: AsyncSession, file_reference: str) -> int:
+    # Bumped by every write-back to the file, from any process (see snapshots.bump_version)
+    versions = snapshots.file_data_versions
+    query = select(versions.c.version).where(versions.c.file_reference == file_reference)
+    return (await db.execute(query)).scalar() or 0
+
+
+async def get_file_aggregates(db: AsyncSession, file_reference: str, groups: list, measures: list):
+    table = await get_registry(database.engine).get_table_async("flight_data")
+    result = await db.execute(aggregates.aggregate_query(table, file_reference, groups, measures))
+    return list(result.keys()), result.fetchall()
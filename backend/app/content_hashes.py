@@ -0,0 +1,143 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, delete, select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import text
+
+# A claim still processing whose ingest has not reported progress for this long
+# is taken to belong to a job that died (killed worker, restart mid-upload)
+CLAIM_TIMEOUT_SECONDS = int(os.getenv("UPLOAD_CLAIM_TIMEOUT_SECONDS", "600"))
+
+PROCESSING = "processing"
+COMPLETED = "completed"
+
+
+# ---------------------------------------
+# Content hashes of ingested uploads
+# ---------------------------------------
+
+content_hash_metadata = MetaData()
+
+# One row per distinct upload content. The unique index is what makes two
+# concurrent uploads of the same workbook resolve to a single File_Reference.
+# status/job_id/updated_at say which job holds the claim and whether it is
+# still alive; rows from before they existed count as completed.
+upload_content_hashes = Table(
+    "upload_content_hashes",
+    content_hash_metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("content_hash", String(64), nullable=False),
+    Column("file_reference", String(255), nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("status", String(20), nullable=False, server_default=COMPLETED),
+    Column("job_id", String(32), nullable=True),
+    Column("updated_at", DateTime, nullable=True),
+    Index("ux_upload_content_hashes_hash", "content_hash", unique=True),
+)
+
+
+def new_hasher():
+    return hashlib.sha256()
+
+
+def get_claim(db: Session, content_hash: str) -> Optional[Row]:
+    c = upload_content_hashes.c
+    return db.execute(
+        select(c.file_reference, c.job_id, c.status, c.updated_at).where(c.content_hash == content_hash)
+    ).first()
+
+
+def claim(db: Session, content_hash: str, file_reference: str, job_id: Optional[str] = None) -> Optional[Row]:
+    """
+    Record `file_reference` (ingested by `job_id`) as the upload holding `content_hash`.
+
+    Returns None when this upload now owns the hash, or the earlier claim's
+    row (file_reference, job_id, status, updated_at) with identical content.
+    """
+    while True:
+        now = datetime.now()
+        try:
+            db.execute(upload_content_hashes.insert().values(
+                content_hash=content_hash, file_reference=file_reference, created_at=now,
+                status=PROCESSING, job_id=job_id, updated_at=now
+            ))
+            db.commit()
+            return None
+        except IntegrityError:
+            db.rollback()
+        existing = get_claim(db, content_hash)
+        if existing is not None:
+            return existing
+        # Released between the insert and the read: try the insert again
+
+
+def is_abandoned(db: Session, existing: Row) -> bool:
+    """
+    Whether an earlier claim can be taken over by a new upload of the same content.
+
+    A claim whose file has a file_upload_log row is finished and never
+    abandoned. Without one it is abandoned unless its job is still processing
+    and has reported progress within CLAIM_TIMEOUT_SECONDS.
+    """
+    logged = db.execute(
+        text("SELECT 1 FROM file_upload_log WHERE File_Reference = :ref LIMIT 1"),
+        {"ref": existing.file_reference}
+    ).first()
+    if logged is not None:
+        return False
+    if existing.status != PROCESSING or existing.updated_at is None:
+        return True
+    return existing.updated_at < datetime.now() - timedelta(seconds=CLAIM_TIMEOUT_SECONDS)
+
+
+def take_over(db: Session, content_hash: str, previous_reference: str, file_reference: str, job_id: Optional[str] = None) -> bool:
+    """
+    Move an abandoned claim from `previous_reference` to this upload.
+
+    Compare-and-set on the previous File_Reference, so of several uploads
+    taking over the same claim exactly one gets True.
+    """
+    c = upload_content_hashes.c
+    now = datetime.now()
+    result = db.execute(
+        update(upload_content_hashes)
+        .where(c.content_hash == content_hash, c.file_reference == previous_reference)
+        .values(file_reference=file_reference, job_id=job_id, status=PROCESSING, created_at=now, updated_at=now)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def heartbeat(db: Session, file_reference: str) -> bool:
+    """
+    Record progress on a claim; False if the claim was taken over or released.
+    """
+    c = upload_content_hashes.c
+    result = db.execute(
+        update(upload_content_hashes)
+        .where(c.file_reference == file_reference, c.status == PROCESSING)
+        .values(updated_at=datetime.now())
+    )
+    db.commit()
+    return result.rowcount > 0
+
+
+def complete(db: Session, file_reference: str):
+    c = upload_content_hashes.c
+    db.execute(
+        update(upload_content_hashes)
+        .where(c.file_reference == file_reference)
+        .values(status=COMPLETED, updated_at=datetime.now())
+    )
+    db.commit()
+
+
+def release(db: Session, file_reference: str):
+    # A failed ingest gives up its hash, so uploading the same file again retries it
+    db.execute(delete(upload_content_hashes).where(upload_content_hashes.c.file_reference == file_reference))
+    db.commit()
@@ -1,49 +1,167 @@
+import logging
+import os
+from typing import TYPE_CHECKING
+
 from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, select
 from sqlalchemy.sql import text
-from . import models, schemas, database
+from . import models, schemas, database, snapshots
+from .schema_registry import get_registry
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
 
 
 
-# Flag to control row insertion behavior
-UPLOAD_ALL_ROWS = False  # Set to True to upload all rows, False to upload only first 10 rows
+# Rows per executemany batch (and per commit) when ingesting an upload
+INSERT_CHUNK_SIZE = int(os.getenv("INSERT_CHUNK_SIZE", "5000"))
 
 def insert_rows_into_test_table(db: Session, data: list):
-    # Insert rows into the 'test' table (up to 10 rows depending on the flag)
-    rows_to_insert = data[:10] if not UPLOAD_ALL_ROWS else data  # Only take first 10 rows if flag is False
-    
-    for row in rows_to_insert:
-        query = text("""
-            INSERT INTO test (File_Reference, Quarter, Year, Marketing_Airline) 
-            VALUES (:File_Reference, :Quarter, :Year, :Marketing_Airline)
-        """)
-        db.execute(query, row)
+    # Insert rows into the 'test' table
+    if not data:
+        return
+
+    query = text("""
+        INSERT INTO test (File_Reference, Quarter, Year, Marketing_Airline) 
+        VALUES (:File_Reference, :Quarter, :Year, :Marketing_Airline)
+    """)
+    db.execute(query, data)
     db.commit()
 
 
-def insert_rows_into_test_table_v2(db: Session, data: list):
-    rows_to_insert = data[:10] if not UPLOAD_ALL_ROWS else data
+def insert_rows_into_test_table_v2(db: Session, data: list, chunk_size: int = INSERT_CHUNK_SIZE) -> int:
+    """
+    Insert every row of `data` into flight_data.
 
-    if not rows_to_insert:
-        return  # No data to insert
+    Rows go to the driver as one executemany per chunk (multi-row VALUES on
+    MySQL) and each chunk is committed on its own. Returns the rows inserted.
+    """
+    if not data:
+        return 0  # No data to insert
 
     # Dynamically get column names from keys of first row
-    columns = list(rows_to_insert[0].keys())
+    columns = list(data[0].keys())
     
     # Prepare placeholders like :File_Reference, :Quarter, etc.
     placeholders = [f":{col}" for col in columns]
 
-    # Construct the SQL query
+    # Construct the SQL query; names like 2nd_Degree__a_ need quoting on some dialects
+    quote = db.get_bind().dialect.identifier_preparer.quote
     query_str = f"""
-        INSERT INTO flight_data ({', '.join(columns)})
+        INSERT INTO flight_data ({', '.join(quote(col) for col in columns)})
         VALUES ({', '.join(placeholders)})
     """
     query = text(query_str)
 
-    # Execute for each row
-    for row in rows_to_insert:
-        db.execute(query, row)
+    inserted = 0
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start:start + chunk_size]
+        db.execute(query, chunk)
+        db.commit()
+        inserted += len(chunk)
 
-    db.commit()
+    return inserted
+
+# Rows per UPDATE ... CASE statement when writing rule results back
+UPDATE_CHUNK_SIZE = 1000
+
+def bulk_update_column(db: Session, column: str, values: list, chunk_size: int = UPDATE_CHUNK_SIZE) -> int:
+    """
+    Write many (id, value) pairs into one flight_data column.
+
+    Each chunk becomes a single UPDATE with a CASE on id instead of one
+    statement per row. Returns the number of rows written; the caller commits.
+    """
+    return bulk_update_columns(db, {column: dict(values)}, chunk_size)
+
+def bulk_update_columns(db: Session, columns: dict, chunk_size: int = UPDATE_CHUNK_SIZE) -> int:
+    """
+    Write {column: {id: value}} into flight_data, all columns in the same statements.
+
+    Every chunk of ids is one UPDATE with a CASE per column; a column keeps its
+    current value for ids it has no entry for. Returns the number of rows
+    written; the caller commits.
+    """
+    row_ids = sorted(set().union(*(values.keys() for values in columns.values()))) if columns else []
+    quote = db.get_bind().dialect.identifier_preparer.quote
+    table = get_registry(database.engine).get_table("flight_data")
+
+    for start in range(0, len(row_ids), chunk_size):
+        chunk = row_ids[start:start + chunk_size]
+        params = {f"id_{i}": row_id for i, row_id in enumerate(chunk)}
+        typed = []  # Values bind with their column's type, so the driver gets e.g. Decimal converted
+        assignments = []
+        for c, (column, values) in enumerate(columns.items()):
+            cases = []
+            for i, row_id in enumerate(chunk):
+                if row_id in values:
+                    params[f"v{c}_{i}"] = values[row_id]
+                    typed.append(bindparam(f"v{c}_{i}", type_=table.c[column].type))
+                    cases.append(f"WHEN :id_{i} THEN :v{c}_{i}")
+            if cases:
+                assignments.append(f"{quote(column)} = CASE id {' '.join(cases)} ELSE {quote(column)} END")
+
+        id_list = ", ".join(f":id_{i}" for i in range(len(chunk)))
+        query = text(f"UPDATE flight_data SET {', '.join(assignments)} WHERE id IN ({id_list})").bindparams(*typed)
+        db.execute(query, params)
+    return len(row_ids)
+
+def update_file_with_expression(db: Session, file_reference: str, column: str, expression, input_columns: list, where=None) -> int:
+    """
+    Set one flight_data column to a SQL expression for a whole file in one statement.
+
+    Rows with a NULL input are left alone, as the Python rule path skips them;
+    `where` narrows the update further (a rule's conditions). Returns the
+    number of rows updated; the caller commits.
+    """
+    table = get_registry(database.engine).get_table("flight_data")
+    query = (
+        table.update()
+        .where(table.c.File_Reference == file_reference)
+        .where(*(table.c[col].isnot(None) for col in input_columns))
+        .values({table.c[column]: expression})
+    )
+    if where is not None:
+        query = query.where(where)
+    return db.execute(query).rowcount
+
+def load_file_frame(db: Session, file_reference: str, columns: list, where=None) -> "pd.DataFrame":
+    # One file's id + columns as an object DataFrame, keeping the raw DB values (None, Decimal, ...)
+    import pandas as pd
+
+    table = get_registry(database.engine).get_table("flight_data")
+    query = select(table.c.id, *(table.c[col] for col in columns if col != "id"))
+    query = query.where(table.c.File_Reference == file_reference)
+    if where is not None:
+        query = query.where(where)  # Only rows matching the rule's conditions are fetched
+    result = db.execute(query)
+    return pd.DataFrame(result.fetchall(), columns=list(result.keys()), dtype=object)
+
+def load_rule_frame(db: Session, file_reference: str, columns: list, where=None) -> "pd.DataFrame":
+    """
+    Like load_file_frame, but reads the columns from the file's snapshot when it has one.
+
+    `where` is still evaluated by the database (string comparisons follow its
+    collation), but only the matching ids come back from it.
+    """
+    frame = snapshots.load_frame(file_reference, columns, db)
+    if frame is None and snapshots.SNAPSHOTS_ENABLED:
+        # Missing or out of date (a crashed or foreign write): rebuild it for this and later runs
+        try:
+            snapshots.build_snapshot(db, file_reference)
+            frame = snapshots.load_frame(file_reference, columns, db)
+        except Exception:
+            logger.exception("Could not rebuild the snapshot for %s", file_reference)
+            snapshots.remove_snapshot(file_reference)
+    if frame is None:
+        return load_file_frame(db, file_reference, columns, where)
+    if where is not None:
+        table = get_registry(database.engine).get_table("flight_data")
+        query = select(table.c.id).where(table.c.File_Reference == file_reference).where(where)
+        frame = frame[frame["id"].isin(db.execute(query).scalars().all())].reset_index(drop=True)
+    return frame
 
 def insert_upload_log(db: Session, log_data: dict):
     # Insert a log entry for the uploaded file
@@ -54,20 +172,25 @@ def insert_upload_log(db: Session, log_data: dict):
     db.execute(query, log_data)
     db.commit()
 
+def delete_file_rows(db: Session, file_reference: str) -> int:
+    # Remove every flight_data row of one file, e.g. the committed chunks of a failed upload
+    result = db.execute(text("DELETE FROM flight_data WHERE File_Reference = :ref"), {"ref": file_reference})
+    db.commit()
+    return result.rowcount
+
 def get_uploaded_files(db: Session):
     return db.query(models.FileUploadLog).order_by(models.FileUploadLog.upload_timestamp.desc()).all()
 
 
 
-def get_file_by_id(db: Session, file_id: int):
+def get_file_by_id(db: Session, file_id: str):
     query = db.query(models.FileUploadLog).filter(models.FileUploadLog.file_reference == file_id)
     print("📌 SQL Query:", str(query))  # Debug: Print SQLAlchemy query string
     return query.first()
 
-FlightDataModel = models.generate_sqlalchemy_model("flight_data", database.engine)
-
-
 def get_test_records_by_file_reference(db: Session, file_reference: str):
+    # ORM model for the reflected flight_data table, cached by the schema registry
+    FlightDataModel = get_registry(database.engine).get_orm_model("flight_data")
     #return db.query(FlightDataModel).filter(FlightDataModel.__table__.columns.get('File_Reference')   == file_reference).all()
     # In the crud.py file, change this line:
     # Ensure File_Reference exists as part of the model
@@ -79,6 +202,48 @@ def get_test_records_by_file_reference(db: Session, file_reference: str):
 
 
 
+# Rows fetched per round trip when streaming a file from a server-side cursor
+STREAM_CHUNK_SIZE = 1000
+
+def file_records_query(file_reference: str, columns: list = None, after_id: int = None, limit: int = None):
+    """
+    Keyset-paginated select of one file's flight_data rows, ordered by id.
+
+    `columns` projects the result (id is always included), `after_id` is the
+    cursor returned with the previous page.
+    """
+    table = get_registry(database.engine).get_table("flight_data")
+    if columns:
+        selected = [table.c.id] + [table.c[col] for col in columns if col != "id"]
+    else:
+        selected = [table]
+    query = select(*selected).where(table.c.File_Reference == file_reference).order_by(table.c.id)
+    if after_id is not None:
+        query = query.where(table.c.id > after_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def get_file_record_rows(db: Session, file_reference: str, columns: list = None, after_id: int = None, limit: int = None):
+    # Core select on the cached flight_data table: plain row tuples, no ORM objects
+    result = db.execute(file_records_query(file_reference, columns, after_id, limit))
+    return list(result.keys()), result.fetchall()
+
+
+def stream_file_record_rows(db: Session, file_reference: str, columns: list = None, after_id: int = None,
+                            chunk_size: int = STREAM_CHUNK_SIZE, limit: int = None):
+    """
+    Yield (keys, rows) chunks from a server-side cursor, so only `chunk_size`
+    rows are held in memory at a time. `limit` caps the rows streamed in total.
+    """
+    query = file_records_query(file_reference, columns, after_id, limit)
+    result = db.execute(query.execution_options(stream_results=True, yield_per=chunk_size))
+    keys = list(result.keys())
+    for rows in result.partitions():
+        yield keys, rows
+
+
 # ✅ NEW FUNCTION to return full file details + test records
 
 def get_file_details_with_records(file_id: int, db: Session) -> schemas.FileDetailsSchema | None:
@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -6,11 +7,34 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+from . import db_config  # reads its settings from the environment loaded above
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL, echo=True)
+# Async drivers for the same database: aiomysql for MySQL, aiosqlite for local SQLite
+ASYNC_DRIVERS = {
+    "mysql+pymysql": "mysql+aiomysql",
+    "mysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def to_async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+# Pool sizing, pre-ping/recycle and echo come from the DB_* settings in db_config
+engine = create_engine(DATABASE_URL, **db_config.engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **db_config.engine_options(ASYNC_DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Statement timings feed the slow-query log and the /metrics DB histograms
+db_config.install_query_timing(engine)
+db_config.install_query_timing(async_engine.sync_engine)
+
 Base = declarative_base()
 
 # Dependency to get the database session
@@ -20,3 +44,9 @@ def get_db():
         yield db  # Yield the session to be used by FastAPI's dependency injection
     finally:
         db.close()  # Ensure that the session is closed after use
+
+
+# Async dependency for handlers that should not block the event loop
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
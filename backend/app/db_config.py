@@ -0,0 +1,128 @@
+import logging
+import os
+import re
+import time
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+# ---------------------------------------
+# Engine / pool settings
+# ---------------------------------------
+
+# Connections kept open per process, and extra ones allowed under burst load
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+# Seconds to wait for a free connection before raising
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Recycle connections before MySQL's wait_timeout drops them server-side
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", "true")
+
+# Full statement logging; off by default since it writes every statement to stdout
+DB_ECHO = _env_bool("DB_ECHO", "false")
+
+# Opt-in log of statements slower than SLOW_QUERY_MS
+SLOW_QUERY_LOG = _env_bool("SLOW_QUERY_LOG", "false")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+
+def engine_options(url: str) -> Dict[str, Any]:
+    """
+    Keyword arguments for create_engine / create_async_engine for `url`.
+    """
+    options: Dict[str, Any] = {"echo": DB_ECHO, "pool_pre_ping": DB_POOL_PRE_PING}
+    if url.startswith("sqlite"):
+        # SQLite is a local file: no server-side timeouts and its own pool class
+        return options
+
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    return options
+
+
+# ---------------------------------------
+# Slow-query log
+# ---------------------------------------
+
+slow_query_logger = logging.getLogger("app.slow_query")
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_PARAM = re.compile(r"%\(\w+\)s|%s|:\w+")
+_WHITESPACE = re.compile(r"\s+")
+
+# Long CASE ... WHEN bulk updates are truncated so one log line stays readable
+FINGERPRINT_MAX_LENGTH = 300
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Normalise a statement so the same query shape logs the same way:
+    literals and bind parameters become ?, and IN/VALUES lists collapse to (?+).
+    """
+    text = _STRING_LITERAL.sub("?", statement)
+    text = _PARAM.sub("?", text)
+    text = _NUMBER_LITERAL.sub("?", text)
+    text = _PLACEHOLDER_LIST.sub("(?+)", text)
+    text = _WHITESPACE.sub(" ", text).strip()
+    if len(text) > FINGERPRINT_MAX_LENGTH:
+        text = text[:FINGERPRINT_MAX_LENGTH] + "..."
+    return text
+
+
+def log_slow_query(statement: str, elapsed_seconds: float, rowcount: int, executemany: bool):
+    if elapsed_seconds * 1000 < SLOW_QUERY_MS:
+        return
+    slow_query_logger.warning(
+        "slow query %.1f ms rows=%s executemany=%s: %s",
+        elapsed_seconds * 1000, rowcount, executemany, fingerprint(statement),
+    )
+
+
+# ---------------------------------------
+# Per-statement timing hooks
+# ---------------------------------------
+
+# Called as listener(statement, elapsed_seconds, rowcount, executemany) after every statement
+QueryListener = Callable[[str, float, int, bool], None]
+query_listeners: List[QueryListener] = []
+
+if SLOW_QUERY_LOG:
+    query_listeners.append(log_slow_query)
+
+
+def install_query_timing(engine: Engine):
+    """
+    Time every statement on `engine` and hand the statement, duration and row
+    count to each function in `query_listeners`.
+
+    For an AsyncEngine pass `async_engine.sync_engine`.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _finish(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+        for listener in query_listeners:
+            listener(statement, elapsed, cursor.rowcount, executemany)
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(context):
+        # Keep the timing stack balanced when a statement raises
+        started = context.connection.info.get("query_started_at") if context.connection is not None else None
+        if started:
+            started.pop()
@@ -0,0 +1,58 @@
+import csv
+import io
+import os
+import tempfile
+from typing import Any, Iterable, Iterator, Sequence, Tuple
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Chunks are (keys, rows) pairs as yielded by crud/async_crud.stream_file_record_rows
+Chunk = Tuple[Sequence[str], Sequence[Sequence[Any]]]
+
+
+# ---------------------------------------
+# CSV
+# ---------------------------------------
+
+def csv_chunk(rows: Iterable[Sequence[Any]]) -> str:
+    """
+    Encode one chunk of rows as CSV text.
+
+    None becomes an empty field; Decimals and datetimes keep their str() form.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+# ---------------------------------------
+# XLSX
+# ---------------------------------------
+
+def write_xlsx(keys: Sequence[str], chunks: Iterator[Chunk], sheet_title: str = "flight_data") -> str:
+    """
+    Write every chunk to a new .xlsx file and return its path; the caller removes it.
+
+    The workbook is write-only: openpyxl serialises each appended row straight
+    to the sheet's XML, so memory stays flat however many rows there are. An
+    .xlsx is a zip with a central directory at the end, so it is finished on
+    disk before it can be sent.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title)
+    sheet.append(list(keys))
+    for _, rows in chunks:
+        for row in rows:
+            sheet.append(list(row))
+
+    fd, path = tempfile.mkstemp(prefix="export-", suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook.save(path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
@@ -0,0 +1,92 @@
+import hashlib
+import os
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, delete, select
+from sqlalchemy.orm import Session
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Rows per fingerprinted chunk; a changed input only recomputes its own chunk
+FINGERPRINT_CHUNK_ROWS = int(os.getenv("FINGERPRINT_CHUNK_ROWS", "5000"))
+
+
+# ---------------------------------------
+# Stored fingerprints of rule inputs
+# ---------------------------------------
+
+fingerprint_metadata = MetaData()
+
+# One row per (file, target column, chunk): the inputs and rule that last wrote that chunk.
+# Keyed by target rather than rule, so another rule writing the same column invalidates it.
+rule_fingerprints = Table(
+    "rule_fingerprints",
+    fingerprint_metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("file_reference", String(255), nullable=False),
+    Column("target_column", String(255), nullable=False),
+    Column("chunk_index", Integer, nullable=False),
+    Column("fingerprint", String(64), nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+    Index("ux_rule_fingerprints_chunk", "file_reference", "target_column", "chunk_index", unique=True),
+)
+
+
+def rule_signature(rule) -> str:
+    # Everything about the rule that changes its output besides the input values
+    return "\x1f".join([rule.equation or "", rule.conditions or "", rule.target_column])
+
+
+def chunk_fingerprints(signature: str, frame: "pd.DataFrame", chunk_rows: int = FINGERPRINT_CHUNK_ROWS) -> List[str]:
+    """
+    Fingerprint consecutive chunks of `frame` (id + input columns, ordered by id).
+
+    Each fingerprint covers the rule signature, the chunk's ids and every
+    input value, so any change to one of them changes the fingerprint.
+    """
+    import pandas as pd
+
+    row_hashes = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    prefix = signature.encode()
+    return [
+        hashlib.blake2b(prefix + row_hashes[start:start + chunk_rows].tobytes(), digest_size=16).hexdigest()
+        for start in range(0, len(frame), chunk_rows)
+    ]
+
+
+def load_fingerprints(db: Session, file_reference: str, target_column: str) -> Dict[int, str]:
+    query = select(rule_fingerprints.c.chunk_index, rule_fingerprints.c.fingerprint).where(
+        rule_fingerprints.c.file_reference == file_reference,
+        rule_fingerprints.c.target_column == target_column,
+    )
+    return dict(db.execute(query).all())
+
+
+def save_fingerprints(db: Session, file_reference: str, target_column: str, fingerprints: List[str], dirty: List[int]):
+    """
+    Store the fingerprints of the `dirty` chunks and drop chunks past the end.
+
+    Runs in the caller's transaction, so fingerprints commit with the write-back.
+    """
+    table = rule_fingerprints
+    scope = (table.c.file_reference == file_reference, table.c.target_column == target_column)
+    db.execute(delete(table).where(*scope, table.c.chunk_index >= len(fingerprints)))
+    if not dirty:
+        return
+    db.execute(delete(table).where(*scope, table.c.chunk_index.in_(dirty)))
+    now = datetime.now()
+    db.execute(table.insert(), [
+        {"file_reference": file_reference, "target_column": target_column, "chunk_index": i,
+         "fingerprint": fingerprints[i], "updated_at": now}
+        for i in dirty
+    ])
+
+
+def clear_fingerprints(db: Session, file_reference: str, target_columns: List[str]):
+    # For writes that do not fingerprint their inputs (SQL push-down, /execute-rules)
+    db.execute(delete(rule_fingerprints).where(
+        rule_fingerprints.c.file_reference == file_reference,
+        rule_fingerprints.c.target_column.in_(target_columns),
+    ))
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from . import database, services
+
+# Threads parsing and inserting uploads in the background
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+
+# Finished jobs kept around for GET /jobs/{id}
+MAX_FINISHED_JOBS = 1000
+
+executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+
+
+class UploadJob:
+    """
+    Progress of one background upload, updated by the worker thread.
+    """
+
+    def __init__(self, file_reference: str, file_name: str):
+        self.id = uuid.uuid4().hex
+        self.file_reference = file_reference
+        self.file_name = file_name
+        self.status = "queued"
+        self.rows_parsed = 0
+        self.rows_inserted = 0
+        self.error: Optional[str] = None
+        self.created_at = datetime.now()  # Wall clock, reported to clients
+        # time.monotonic() readings, only used for elapsed_seconds
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def parsed(self, count: int):
+        with self._lock:
+            self.rows_parsed += count
+
+    def inserted(self, count: int):
+        with self._lock:
+            self.rows_inserted += count
+
+    @property
+    def elapsed_seconds(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "file_reference": self.file_reference,
+                "file_name": self.file_name,
+                "created_at": self.created_at.isoformat(),
+                "rows_parsed": self.rows_parsed,
+                "rows_inserted": self.rows_inserted,
+                "elapsed_seconds": round(self.elapsed_seconds, 3),
+                "error": self.error,
+            }
+
+
+_jobs: "OrderedDict[str, UploadJob]" = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def _run_upload(job: UploadJob, file_location: str, ext: str):
+    job.status = "running"
+    job.started_at = time.monotonic()
+    db = database.SessionLocal()  # Each job gets its own session
+    try:
+        services.ingest_upload(db, job.file_reference, file_location, ext, job)
+        job.status = "completed"
+    except Exception as e:
+        db.rollback()
+        job.error = str(e)
+        job.status = "failed"
+    finally:
+        job.finished_at = time.monotonic()
+        db.close()
+        _prune_finished()
+
+
+def _prune_finished():
+    with _jobs_lock:
+        finished = [job_id for job_id, job in _jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del _jobs[job_id]
+
+
+def submit_upload(job: UploadJob, file_location: str, ext: str) -> UploadJob:
+    # The job is created first so its id can be stored with the upload's content-hash claim
+    with _jobs_lock:
+        _jobs[job.id] = job
+    executor.submit(_run_upload, job, file_location, ext)
+    return job
+
+
+def get_job(job_id: str) -> Optional[UploadJob]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
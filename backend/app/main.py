@@ -1,36 +1,59 @@
 import decimal
-from http.client import HTTPException
+import json
+import os
+import time
+from contextlib import asynccontextmanager
 
 
 from pydantic import BaseModel
 
-from typing import List, Dict, Any, Union
-from fastapi import FastAPI, UploadFile, File, Depends
+from typing import List, Dict, Any, Optional, Union
+from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import MetaData, Table, select, text
+from sqlalchemy import MetaData, Table, or_, select, text
 
 from sqlalchemy.engine import Engine
+from sqlalchemy.exc import NoSuchTableError
 from .database import engine  # Assuming you have this already
 
-from .pydantic_utils import table_to_pydantic
 
 
-
-from . import crud, models, services, database
-from .database import get_db
+from . import crud, models, services, database, rule_engine, jobs, serializers, migrations, async_crud, metrics, aggregates, snapshots, fingerprints, rule_runner, exporters
+from .database import get_db, get_async_db
 from .schemas import FileUploadLogSchema ,  FileDetailsSchema, table_to_pydantic
 
-from .models import FileUploadLog, MathRule, generate_sqlalchemy_model
+from .models import FileUploadLog, MathRule
+from .schema_registry import get_registry
+
+
 
 
 
 
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Bring indexes up to date before serving; the applied versions are recorded in schema_migrations
+    if os.getenv("RUN_MIGRATIONS", "true").lower() == "true":
+        migrations.apply_migrations(engine)
+    # Reflect flight_data now rather than at import time, so importing the app needs no database
+    try:
+        get_registry(engine).get_table("flight_data")
+    except NoSuchTableError:
+        pass  # Reflected on first use once the table exists
+    # Leftovers of write-backs that crashed; their snapshots are rebuilt on the next rule run
+    snapshots.recover_snapshots()
+    yield
+    rule_runner.shutdown_pool()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS settings
 
@@ -44,55 +67,204 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency and DB time, exported on /metrics
+app.middleware("http")(metrics.metrics_middleware)
+
+
+@app.get("/metrics")
+def get_metrics():
+    content, media_type = metrics.render_latest()
+    return Response(content=content, media_type=media_type)
+
 @app.post("/upload/")
 async def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    file_reference = services.process_file_upload(file, db)
+    # Only the copy to disk (and its content hash) happens in the request; parsing and inserting run in the job pool
+    file_reference, file_location, ext, content_hash = await run_in_threadpool(services.save_upload, file)
+    try:
+        await run_in_threadpool(services.check_upload_format, file_location, ext)
+    except services.UnsupportedFileFormat as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
+    # Identical content is not parsed again: answer with the reference and job of the upload holding it
+    job = jobs.UploadJob(file_reference, file.filename)
+    existing = await run_in_threadpool(services.claim_upload, db, file_reference, file_location, content_hash, job.id)
+    if existing is not None:
+        return {
+            "message": "Identical file already uploaded",
+            "file_reference": existing["file_reference"],
+            "job_id": existing["job_id"],
+            "status": existing["status"],
+            "duplicate": True
+        }
+
+    jobs.submit_upload(job, file_location, ext)
     return {
-        "message": "File uploaded successfully",
-        "file_reference": file_reference
+        "message": "File uploaded successfully, processing started",
+        "file_reference": file_reference,
+        "job_id": job.id,
+        "status": job.status,
+        "duplicate": False
     }
 
+@app.get("/jobs/{job_id}")
+def get_upload_job(job_id: str):
+    job = jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
 @app.get("/files/", response_model=list[FileUploadLogSchema])
-async def get_files(db: Session = Depends(get_db)):
-    return crud.get_uploaded_files(db)
+async def get_files(db: AsyncSession = Depends(get_async_db)):
+    return await async_crud.get_uploaded_files(db)
 
-#FlightDataSchema = table_to_pydantic("flight_data")
-@app.get("/files/{file_id}")
-def get_file_details(file_id: int, db: Session = Depends(get_db)):
-    file = crud.get_file_by_id(db, file_id)
+async def file_details_response(file_id: str, db: AsyncSession, cursor: Optional[int] = None,
+                                limit: Optional[int] = None, columns: Optional[str] = None,
+                                format: str = "json"):
+    file = await async_crud.get_file_by_id(db, file_id)
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
 
-    records = crud.get_test_records_by_file_reference(db, file.file_reference)
+    # Reflected off the event loop if not cached; the row queries below then find it cached
+    table = await get_registry(engine).get_table_async("flight_data")
+    selected = parse_columns(columns, table)
+
+    if format == "ndjson":
+        # One record per line, read from a server-side cursor with its own session;
+        # with a limit the client pages on by passing the last record's id as ?cursor=
+        return StreamingResponse(
+            stream_file_records(file.file_reference, selected, cursor, limit),
+            media_type="application/x-ndjson"
+        )
+
+    # Core rows go straight to JSON; no per-request Pydantic model or per-row validation.
+    # The file's columnar snapshot serves the page when there is one.
+    snapshot_page = await run_in_threadpool(snapshots.read_rows, file.file_reference, selected, cursor, limit)
+    if snapshot_page is not None:
+        keys, rows = snapshot_page
+    else:
+        keys, rows = await async_crud.get_file_record_rows(db, file.file_reference, selected, cursor, limit)
 
-    if not records:
-        return {
-            "file": FileUploadLogSchema.from_orm(file),
-            "records": []
-        }
+    payload = {
+        "file": serializers.file_log_to_dict(file),
+        "records": serializers.rows_to_dicts(keys, rows)
+    }
+    if limit is not None:
+        # Keyset pagination: pass next_cursor back as ?cursor= for the following page
+        payload["next_cursor"] = rows[-1][0] if len(rows) == limit else None
 
-    # Generate dynamic Pydantic model for `flight_data` table
-    FlightDataSchema = table_to_pydantic("flight_data", database.engine)
+    # Encoding a large file is CPU work: keep it off the event loop
+    content = await run_in_threadpool(serializers.dumps, payload)
+    return Response(content=content, media_type="application/json")
 
-    # Convert records to list of Pydantic instances
-    record_data = [FlightDataSchema.from_orm(record).dict() for record in records]
 
-    return {
-        "file": FileUploadLogSchema.from_orm(file),
-        "records": record_data
-    }
+def parse_columns(columns: Optional[str], table: Table) -> Optional[List[str]]:
+    if not columns:
+        return None
+    selected = [col.strip() for col in columns.split(",") if col.strip()]
+    unknown = [col for col in selected if col not in table.c]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+    return selected
 
 
-def table_to_pydantic_fixed(table_name: str, engine):
-    # Reflect the table
-    from sqlalchemy import MetaData, Table
-    metadata = MetaData()
-    metadata.reflect(bind=engine)
+async def stream_file_records(file_reference: str, columns: Optional[List[str]], cursor: Optional[int],
+                              limit: Optional[int] = None):
+    async with database.AsyncSessionLocal() as db:
+        async for keys, rows in async_crud.stream_file_record_rows(db, file_reference, columns, cursor, limit=limit):
+            yield "".join(serializers.dumps(record) + "\n" for record in serializers.rows_to_dicts(keys, rows))
 
-    if table_name not in metadata.tables:
-        raise ValueError(f"Table '{table_name}' not found in the database.")
+@app.get("/files/{file_id}")
+async def get_file_details(file_id: str, cursor: Optional[int] = None,
+                           limit: Optional[int] = Query(None, ge=1, le=10000),
+                           columns: Optional[str] = None,
+                           format: str = Query("json", pattern="^(json|ndjson)$"),
+                           db: AsyncSession = Depends(get_async_db)):
+    return await file_details_response(file_id, db, cursor, limit, columns, format)
+
+
+def export_keys(file_reference: str, columns: Optional[List[str]]) -> List[str]:
+    # Header row, taken from the query itself so a file with no rows still gets one
+    return list(crud.file_records_query(file_reference, columns).selected_columns.keys())
 
-    table = metadata.tables[table_name]
+
+async def stream_file_csv(file_reference: str, columns: Optional[List[str]]):
+    yield exporters.csv_chunk([export_keys(file_reference, columns)])
+    async with database.AsyncSessionLocal() as db:
+        async for _, rows in async_crud.stream_file_record_rows(db, file_reference, columns):
+            yield exporters.csv_chunk(rows)
+
+
+def write_file_xlsx(file_reference: str, columns: Optional[List[str]]) -> str:
+    db = database.SessionLocal()
+    try:
+        chunks = crud.stream_file_record_rows(db, file_reference, columns)
+        return exporters.write_xlsx(export_keys(file_reference, columns), chunks)
+    finally:
+        db.close()
+
+
+@app.get("/files/{file_id}/export")
+async def export_file(file_id: str, format: str = Query("csv", pattern="^(csv|xlsx)$"),
+                      columns: Optional[str] = None,
+                      db: AsyncSession = Depends(get_async_db)):
+    # Rows come from a server-side cursor in chunks and are encoded as they arrive
+    file = await async_crud.get_file_by_id(db, file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+    table = await get_registry(engine).get_table_async("flight_data")
+    selected = parse_columns(columns, table)
+    filename = f"{file.file_reference}.{format}"
+
+    if format == "csv":
+        return StreamingResponse(
+            stream_file_csv(file.file_reference, selected),
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+
+    # Write-only workbook built in a temp file off the event loop, sent in chunks, then removed
+    path = await run_in_threadpool(write_file_xlsx, file.file_reference, selected)
+    return FileResponse(path, media_type=exporters.XLSX_MEDIA_TYPE, filename=filename,
+                        background=BackgroundTask(os.remove, path))
+
+
+@app.get("/files/{file_id}/aggregate")
+async def get_file_aggregate(file_id: str, group_by: str = "", measures: str = "",
+                             db: AsyncSession = Depends(get_async_db)):
+    # e.g. ?group_by=Marketing_Airline,Quarter&measures=Total_Passengers,ASMs,Seats:avg
+    file = await async_crud.get_file_by_id(db, file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    table = await get_registry(engine).get_table_async("flight_data")
+    try:
+        groups, parsed = aggregates.parse_aggregate_spec(table, group_by, measures)
+    except aggregates.AggregateSpecError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    key = (tuple(groups), tuple(parsed))
+    cache = aggregates.aggregate_cache
+    # Read in the same transaction as the aggregate query, so a result is stored under the version it reflects
+    version = await async_crud.get_file_data_version(db, file.file_reference)
+    payload = cache.get(file.file_reference, key, version)
+    if payload is None:
+        keys, rows = await async_crud.get_file_aggregates(db, file.file_reference, groups, parsed)
+        payload = {
+            "file_reference": file.file_reference,
+            "group_by": groups,
+            "measures": [f"{col}_{function}" for col, function in parsed],
+            "groups": serializers.rows_to_dicts(keys, rows)
+        }
+        cache.put(file.file_reference, key, payload, version)
+    return serializers.json_response(payload)
+
+
+def table_to_pydantic_fixed(table_name: str, engine):
+    # Reflected table comes from the schema registry cache
+    try:
+        table = get_registry(engine).get_table(table_name)
+    except NoSuchTableError:
+        raise ValueError(f"Table '{table_name}' not found in the database.")
     
     # Dynamically create a Pydantic model
     Model = sqlalchemy_to_pydantic(table)
@@ -104,29 +276,13 @@ def table_to_pydantic_fixed(table_name: str, engine):
     return Model
 
 @app.get("/filesv1/{file_id}")
-def get_file_details(file_id: int, db: Session = Depends(database.get_db)):
-    file = crud.get_file_by_id(db, file_id)
-    if not file:
-        raise HTTPException(status_code=404, detail="File not found")
-
-    records = crud.get_test_records_by_file_reference(db, file.file_reference)
-
-    if not records:
-        return {
-            "file": FileUploadLogSchema.from_orm(file),  # Convert ORM object to Pydantic
-            "records": []
-        }
-
-    # Generate dynamic Pydantic model for `flight_data` table
-    FlightDataSchema = table_to_pydantic("flight_data", database.engine)
-
-    # Convert records to list of Pydantic instances
-    record_data = [FlightDataSchema.from_orm(record).dict() for record in records]
-    print(record_data)
-    return {
-        "file": FileUploadLogSchema.from_orm(file),  # Convert ORM object to Pydantic
-        "records": record_data
-    }
+async def get_file_details_v1(file_id: str, cursor: Optional[int] = None,
+                              limit: Optional[int] = Query(None, ge=1, le=10000),
+                              columns: Optional[str] = None,
+                              format: str = Query("json", pattern="^(json|ndjson)$"),
+                              db: AsyncSession = Depends(get_async_db)):
+    # Same as /files/{file_id}; the frontend's DataTable and FileDetails call this path
+    return await file_details_response(file_id, db, cursor, limit, columns, format)
 
 
 
@@ -141,16 +297,19 @@ def map_python_type_to_frontend(python_type: type) -> str:
     else:
         return "string"
 
+@app.post("/schema-cache/invalidate")
+def invalidate_schema_cache(table_name: Optional[str] = None):
+    # Drop cached reflections after a schema change instead of waiting for the TTL
+    get_registry(engine).invalidate(table_name)
+    return {"message": "Schema cache invalidated", "table_name": table_name}
+
 @app.get("/get-columns/{table_name}")
 def get_columns(table_name: str):
-    metadata = MetaData()
-    metadata.reflect(bind=engine)
-
-    if table_name not in metadata.tables:
+    try:
+        table: Table = get_registry(engine).get_table(table_name)
+    except NoSuchTableError:
         raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found")
 
-    table: Table = metadata.tables[table_name]
-
     column_data = []
     for col in table.columns:
         
@@ -171,22 +330,8 @@ class ColumnsRequest(BaseModel):
     columns: List[str]
    
 @app.post("/get-first-row/")
-def get_first_row(data: ColumnsRequest, db: Session = Depends(get_db)):
-    table_name = "flight_data"
-    metadata = MetaData()
-    metadata.reflect(bind=engine)
-    table = metadata.tables[table_name]
-
-    
- 
-
-    selected_columns = [table.c[col] for col in data.columns if col in table.c]
-    query = select(*selected_columns).limit(1)
-    result = db.execute(query).fetchone()
-
-    if result:
-        return dict(result._mapping)
-    return {}
+async def get_first_row(data: ColumnsRequest, db: AsyncSession = Depends(get_async_db)):
+    return await async_crud.get_first_row(db, data.columns)
 
 class ConditionItem(BaseModel):
     id: int
@@ -217,20 +362,43 @@ class SaveRuleRequest(BaseModel):
 
 @app.post("/save-rule/")
 def save_rule(rule: SaveRuleRequest, db: Session = Depends(get_db)):
-    print("Came Here")
+    # Validate the equation against the flight_data columns before storing it
+    columns = get_registry(engine).get_table("flight_data").c.keys()
+    if rule.target_column not in columns:
+        raise HTTPException(status_code=400, detail=f"Unknown target column '{rule.target_column}'")
+    try:
+        compiled = rule_engine.compile_rule(rule.equation, columns)
+    except rule_engine.RuleValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid equation: {e}")
+    # selcols decides which columns are loaded for the rule, so it must name exactly the equation's columns;
+    # left empty, it is filled in from the equation
+    stored_selcols = rule.selcols if rule.selcols.strip("| ") else rule_engine.format_selcols(compiled.columns)
+    selcols = set(rule_engine.parse_selcols(stored_selcols))
+    missing = [col for col in compiled.columns if col not in selcols]
+    extra = sorted(selcols - set(compiled.columns))
+    if missing or extra:
+        raise HTTPException(
+            status_code=400,
+            detail=f"selcols must list the equation's columns; missing: {missing}, not in the equation: {extra}"
+        )
+    try:
+        rule_engine.compile_conditions(rule.conditions, get_registry(engine).get_table("flight_data"))
+    except rule_engine.RuleValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid conditions: {e}")
 
     new_rule = MathRule(
         rule_name=rule.rule_name,
         rule_description=rule.rule_description,
         target_column=rule.target_column,
         conditions=rule.conditions,   # Just storing as plain string
-        equation=rule.equation,        # Just storing as plain string
-        selcols=rule.selcols
+        equation=rule.equation,   # Stored as written; validated above
+        selcols=stored_selcols
     )
 
     db.add(new_rule)
     db.commit()
     db.refresh(new_rule)
+    rule_engine.get_compiled_rule(new_rule)  # The first run finds it already compiled
 
     return {"message": "Rule saved successfully", "id": new_rule.id}
 
@@ -243,23 +411,19 @@ def execute_rule(rule_name: str, db: Session = Depends(get_db)):
 
     try:
         # Parse conditions if they're in stringified JSON format
-        parsed_conditions = json.loads(rule.conditions)
-    except Exception as e:
-        parsed_conditions = f"Error parsing conditions: {e}"
+        parsed_conditions = json.loads(rule.conditions) if rule.conditions else None
+    except Exception:
+        parsed_conditions = rule.conditions   # SQL-style text such as "DOM_INT = 'DOM'"
 
-    try:
-        # Equation is typically a string like: Total_Passengers + Seats + 100
-        parsed_equation = rule.equation
-    except Exception as e:
-        parsed_conditions = None
+    # Equation is typically a string like: Total_Passengers + Seats + 100
+    parsed_equation = rule.equation
 
-    parsed_conditions = None
     # Return nicely formatted details
     return {
         "Rule Name": rule.rule_name,
         "Description": rule.rule_description,
         "Target Column": rule.target_column,
-        #"Conditions": parsed_conditions,
+        "Conditions": parsed_conditions,
         "Equation": parsed_equation,
         "selcols":rule.selcols
     }
@@ -268,13 +432,15 @@ def execute_rule(rule_name: str, db: Session = Depends(get_db)):
 
 
 @app.get("/rules")
-def get_all_rules(db: Session = Depends(get_db)):
-        rules = db.query(MathRule).all()
+async def get_all_rules(db: AsyncSession = Depends(get_async_db)):
+        rules = await async_crud.get_rules(db)
         return [{"id": rule.id, "name": rule.rule_name, "equation": rule.equation, "tcolumn" : rule.target_column, "selcols":rule.selcols} for rule in rules]
 
 class ExecuteRuleRequest(BaseModel):
     rule_id: int
     file_id: int
+    mode: rule_runner.RuleMode = "auto"   # "auto", "sql" (push down to the database) or "python"
+    force: bool = False  # python mode: recompute every chunk, even ones whose inputs are unchanged
 
 
 @app.post("/execute-rule")
@@ -284,73 +450,153 @@ def execute_rule_on_all_data(data: ExecuteRuleRequest, db: Session = Depends(get
     if not rule:
         raise HTTPException(status_code=404, detail="Rule not found")
 
+    # Step 2: Get the filereference from upload log
+    file_reference = db.query(FileUploadLog).filter(FileUploadLog.id == data.file_id).first()
+    if not file_reference:
+        raise HTTPException(status_code=404, detail="Upload log not found")
+
+    # Step 3: Evaluate and write back (SQL push-down or incremental Python)
     try:
-        selcols = selcols = rule.selcols.strip('|').split('||')
-        equation = rule.equation
-        target_col = rule.target_column
+        result = rule_runner.run_rule(db, rule, file_reference.file_reference, data.mode, data.force)
+    except rule_runner.RuleRunError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-       
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid rule format: {e}")
-    
+    if result["rows_written"] or result["mode"] == "sql":
+        aggregates.aggregate_cache.invalidate(file_reference.file_reference)
+    metrics.record_rule_execution(result["mode"], result["rows_evaluated"], result["rows_written"])
+    return result
 
 
-    # 2. Get the filereference from upload log
-    file_reference = db.query(FileUploadLog).filter(FileUploadLog.id == data.file_id).first()
-    if not file_reference:
-        raise HTTPException(status_code=404, detail="Upload log not found")
-   
+class ExecuteRuleBatchRequest(BaseModel):
+    rule_id: int
+    file_ids: List[int]
+    mode: rule_runner.RuleMode = "auto"
+    force: bool = False
 
-    # Step 2: Fetch all rows with id and selected columns
-   # Step 1: Build the column query string
-    col_query = ", ".join(["id"] + selcols)
 
-    # Step 2: Extract the file reference value
-    file_ref_value = file_reference.file_reference  # assuming `file_reference` is a SQLAlchemy model object
+@app.post("/execute-rule/batch")
+def execute_rule_on_many_files(data: ExecuteRuleBatchRequest, db: Session = Depends(get_db)):
+    # Step 1: Check the rule and every file exist before starting any work
+    rule = db.query(MathRule).filter(MathRule.id == data.rule_id).first()
+    if not rule:
+        raise HTTPException(status_code=404, detail="Rule not found")
 
-    # Step 3: Prepare the SQL query
-    query = text(f"SELECT {col_query} FROM flight_data WHERE File_Reference = :file_ref_value")
+    file_ids = list(dict.fromkeys(data.file_ids))
+    logs = db.query(FileUploadLog).filter(FileUploadLog.id.in_(file_ids)).all()
+    missing = set(file_ids) - {log.id for log in logs}
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Upload logs not found: {sorted(missing)}")
+    references = {log.id: log.file_reference for log in logs}
+    db.close()  # Workers use their own connections; don't hold this one for the whole batch
+
+    # Step 2: One partition per File_Reference, evaluated in parallel in the rule worker processes
+    started = time.perf_counter()
+    results = rule_runner.run_rule_batch(data.rule_id, [references[file_id] for file_id in file_ids], data.mode, data.force)
+    seconds = time.perf_counter() - started
+
+    # Step 3: Caches and metrics live in this process, so they are updated here
+    files = []
+    counted = set()
+    for file_id, result in zip(file_ids, results):
+        if result["status"] == "completed" and result["file_reference"] not in counted:
+            counted.add(result["file_reference"])  # Upload logs sharing a reference ran as one partition
+            if result["rows_written"] or result["mode"] == "sql":
+                aggregates.aggregate_cache.invalidate(result["file_reference"])
+            metrics.record_rule_execution(result["mode"], result["rows_evaluated"], result["rows_written"])
+        files.append({"file_id": file_id, **result})
+
+    rows_written = sum(result.get("rows_written", 0) for result in {r["file_reference"]: r for r in results}.values())
+    return {
+        "message": f"Rule '{rule.rule_name}' executed for {len(file_ids)} files",
+        "files": files,
+        "failed": sum(1 for result in results if result["status"] == "failed"),
+        "rows_written": rows_written,
+        "workers": min(rule_runner.RULE_WORKERS, len(set(references.values()))),
+        "seconds": round(seconds, 4),
+        "rows_per_second": round(rows_written / seconds) if seconds else rows_written
+    }
 
-    # Step 4: Execute and get dictionary-like results using .mappings()
-    rows = db.execute(query, {"file_ref_value": file_ref_value}).mappings().all()
-    
+class ExecuteRulesRequest(BaseModel):
+    rule_ids: List[int]
+    file_id: int
 
-    if not rows:
-        raise HTTPException(status_code=404, detail="No rows in flight_data")
 
-    results = []
+@app.post("/execute-rules")
+def execute_rules_on_all_data(data: ExecuteRulesRequest, db: Session = Depends(get_db)):
+    # Step 1: Fetch the rules and order them so each runs after the rules feeding it
+    rules = db.query(MathRule).filter(MathRule.id.in_(data.rule_ids)).all()
+    missing = set(data.rule_ids) - {rule.id for rule in rules}
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Rules not found: {sorted(missing)}")
 
-    # Step 3: Loop through all rows and compute
-    for row in rows:
-        row_dict = dict(row)
-        row_id = row_dict.pop("id")
+    try:
+        ordered = rule_engine.order_rules(rules)
+        compiled = {rule.id: rule_engine.get_compiled_rule(rule) for rule in ordered}
+        table = get_registry(engine).get_table("flight_data")
+        conditions = {rule.id: rule_engine.compile_conditions(rule.conditions, table) for rule in ordered}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid rule format: {e}")
 
-        try:
-            result = eval(equation, {"__builtins__": {}}, row_dict)
-        
-           
-        except Exception as e:
-            result = None  # Or log error
-            continue
-
-        # Step 4: Update target column
-        update_query = text(f"UPDATE flight_data SET {target_col} = :result WHERE id = :id")
-        # Print the SQL query for debugging purposes
-        print(f"SQL Query: {str(update_query)}")
-        print(f"Parameters: result = {result}, id = {row_id}")
-        db.execute(update_query, {"result": result, "id": row_id})
-
-        results.append({
-            "row_id": row_id,
-            "used_values": row_dict,
-            "result": result
+    file_reference = db.query(FileUploadLog).filter(FileUploadLog.id == data.file_id).first()
+    if not file_reference:
+        raise HTTPException(status_code=404, detail="Upload log not found")
+
+    # Step 2: Load every input and target column of the file once.
+    # Targets are loaded too: rows a rule skips keep their stored value for later rules.
+    columns = []
+    for rule in ordered:
+        condition_columns = conditions[rule.id].columns if conditions[rule.id] is not None else []
+        for col in rule_engine.parse_selcols(rule.selcols) + [rule.target_column] + condition_columns:
+            if col not in columns:
+                columns.append(col)
+
+    # When every rule is conditional, only rows matching at least one of them are fetched;
+    # not when a condition reads a column one of the rules writes, as stored values may still change
+    targets = {rule.target_column for rule in ordered}
+    where = None
+    if all(condition is not None and not targets.intersection(condition.columns) for condition in conditions.values()):
+        where = or_(*(condition.to_sql() for condition in conditions.values()))
+
+    frame = crud.load_rule_frame(db, file_reference.file_reference, columns, where)
+    if frame.empty and where is None:
+        raise HTTPException(status_code=404, detail="No rows in flight_data")
+    row_ids = frame.pop("id")
+
+    # Step 3: Run the rules in dependency order over the in-memory frame
+    updates = {}
+    summary = []
+    for rule in ordered:
+        started = time.perf_counter()
+        inputs = frame[rule_engine.parse_selcols(rule.selcols)]
+        if conditions[rule.id] is not None:
+            # Conditions are re-checked per rule: earlier rules may have changed the filter columns
+            inputs = inputs[conditions[rule.id].mask(frame)]
+        computed = compiled[rule.id].evaluate(inputs)
+        frame.loc[computed.index, rule.target_column] = computed
+        updates[rule.target_column] = dict(zip(row_ids.loc[computed.index].tolist(), computed.tolist()))
+        summary.append({
+            "rule_id": rule.id,
+            "rule_name": rule.rule_name,
+            "target_column": rule.target_column,
+            "rows_computed": len(computed),
+            "seconds": round(time.perf_counter() - started, 4)
         })
 
-    db.commit()
+    # Step 4: Write every target column back in the same statements
+    with snapshots.write_back(db, file_reference.file_reference, list(updates)):
+        write_started = time.perf_counter()
+        rows_written = crud.bulk_update_columns(db, updates)
+        fingerprints.clear_fingerprints(db, file_reference.file_reference, list(updates))
+        db.commit()
+        write_seconds = time.perf_counter() - write_started
+    aggregates.aggregate_cache.invalidate(file_reference.file_reference)
+    metrics.record_rule_execution("batch", sum(item["rows_computed"] for item in summary), rows_written)
 
-    # Step 5: Return the result
     return {
-        "message": f"Rule '{rule.rule_name}' executed for {len(results)} rows",
-        "results": results[:10],  # Return top 10 results for preview
-        "target_column": target_col
-    }
\ No newline at end of file
+        "message": f"{len(ordered)} rules executed over {len(frame)} rows",
+        "order": [rule.id for rule in ordered],
+        "rules": summary,
+        "rows_written": rows_written,
+        "write_seconds": round(write_seconds, 4),
+        "rows_per_second": round(rows_written / write_seconds) if write_seconds else rows_written
+    }
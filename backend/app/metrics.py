@@ -0,0 +1,125 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import Request
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, REGISTRY
+
+from . import db_config
+
+
+# ---------------------------------------
+# HTTP and database timings
+# ---------------------------------------
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency by route",
+    ["method", "route", "status"],
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Time spent in database statements per request",
+    ["method", "route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_STATEMENTS = Counter("db_statements_total", "Statements executed")
+DB_STATEMENT_SECONDS = Histogram("db_statement_duration_seconds", "Duration of single statements")
+
+# ---------------------------------------
+# Domain throughput
+# ---------------------------------------
+
+UPLOADS = Counter("uploads_total", "Processed uploads by outcome", ["status"])
+UPLOAD_SECONDS = Histogram(
+    "upload_processing_seconds", "Time to parse and insert one upload",
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+UPLOAD_ROWS_PARSED = Counter("upload_rows_parsed_total", "Rows parsed from uploaded files")
+UPLOAD_ROWS_INSERTED = Counter("upload_rows_inserted_total", "Rows inserted into flight_data from uploads")
+
+RULE_EXECUTIONS = Counter("rule_executions_total", "Rule executions by mode", ["mode"])
+RULE_ROWS_EVALUATED = Counter("rule_rows_evaluated_total", "Rows a rule was evaluated for", ["mode"])
+RULE_ROWS_WRITTEN = Counter("rule_rows_written_total", "Rows written back by rule executions", ["mode"])
+
+
+# Running DB time of the current request; a mutable holder so statements run
+# in the threadpool add to the same total as the handler that started them
+_request_db_seconds: ContextVar[Optional[list]] = ContextVar("request_db_seconds", default=None)
+
+
+def observe_query(statement: str, elapsed_seconds: float, rowcount: int, executemany: bool):
+    DB_STATEMENTS.inc()
+    DB_STATEMENT_SECONDS.observe(elapsed_seconds)
+    holder = _request_db_seconds.get()
+    if holder is not None:
+        holder[0] += elapsed_seconds
+
+
+db_config.query_listeners.append(observe_query)
+
+
+def record_rule_execution(mode: str, rows_evaluated: int, rows_written: int):
+    RULE_EXECUTIONS.labels(mode).inc()
+    RULE_ROWS_EVALUATED.labels(mode).inc(rows_evaluated)
+    RULE_ROWS_WRITTEN.labels(mode).inc(rows_written)
+
+
+# ---------------------------------------
+# Cache hit rates, read at scrape time
+# ---------------------------------------
+
+class CacheCollector:
+    """
+    Exposes hits/misses of the compiled-rule LRU, the schema registry and
+    the per-file aggregate cache.
+    """
+
+    def collect(self):
+        from . import aggregates, rule_engine
+        from .schema_registry import get_registry
+
+        hits = CounterMetricFamily("cache_hits", "Cache lookups served from the cache", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache lookups that had to build the entry", labels=["cache"])
+
+        info = rule_engine._compiled_rule.cache_info()
+        hits.add_metric(["compiled_rule"], info.hits)
+        misses.add_metric(["compiled_rule"], info.misses)
+
+        registry = get_registry()
+        hits.add_metric(["schema"], registry.hits)
+        misses.add_metric(["schema"], registry.misses)
+
+        hits.add_metric(["aggregate"], aggregates.aggregate_cache.hits)
+        misses.add_metric(["aggregate"], aggregates.aggregate_cache.misses)
+
+        yield hits
+        yield misses
+
+
+REGISTRY.register(CacheCollector())
+
+
+# ---------------------------------------
+# Middleware and endpoint
+# ---------------------------------------
+
+async def metrics_middleware(request: Request, call_next):
+    holder = [0.0]
+    token = _request_db_seconds.set(holder)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        _request_db_seconds.reset(token)
+        # Label by the route template (/files/{file_id}), not the raw path
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        REQUEST_SECONDS.labels(request.method, route_path, str(status)).observe(time.perf_counter() - started)
+        REQUEST_DB_SECONDS.labels(request.method, route_path).observe(holder[0])
+
+
+def render_latest():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,130 @@
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn
+
+from . import content_hashes, fingerprints, snapshots
+
+
+# ---------------------------------------
+# Versioned schema migrations
+# ---------------------------------------
+
+migration_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _create_index(table_name: str, index_name: str, *column_names: str) -> Callable[[Connection], None]:
+    def apply(conn: Connection):
+        table = Table(table_name, MetaData(), autoload_with=conn)
+        Index(index_name, *(table.c[col] for col in column_names)).create(bind=conn, checkfirst=True)
+    return apply
+
+
+def _add_columns(table: Table, *column_names: str) -> Callable[[Connection], None]:
+    # Columns already there (a table created after they were added to `table`) are skipped
+    def apply(conn: Connection):
+        existing = {col["name"] for col in inspect(conn).get_columns(table.name)}
+        table_name = conn.dialect.identifier_preparer.format_table(table)
+        for name in column_names:
+            if name not in existing:
+                column_spec = CreateColumn(table.c[name]).compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_spec}"))
+    return apply
+
+
+# (version, name, step) in the order they are applied. Never edit a shipped
+# entry; add a new version instead.
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "index file_upload_log.File_Reference",
+     _create_index("file_upload_log", "ix_file_upload_log_file_reference", "File_Reference")),
+    # Serves File_Reference lookups and keyset pages ordered by id from one index
+    (2, "index flight_data (File_Reference, id)",
+     _create_index("flight_data", "ix_flight_data_file_reference_id", "File_Reference", "id")),
+    (3, "create rule_fingerprints",
+     lambda conn: fingerprints.rule_fingerprints.create(bind=conn, checkfirst=True)),
+    (4, "create upload_content_hashes",
+     lambda conn: content_hashes.upload_content_hashes.create(bind=conn, checkfirst=True)),
+    (5, "create file_data_versions",
+     lambda conn: snapshots.file_data_versions.create(bind=conn, checkfirst=True)),
+    (6, "add status, job_id, updated_at to upload_content_hashes",
+     _add_columns(content_hashes.upload_content_hashes, "status", "job_id", "updated_at")),
+]
+
+
+def applied_versions(conn: Connection) -> set:
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def apply_migrations(engine: Engine) -> List[int]:
+    """
+    Create the version table if needed and run every migration not yet recorded.
+
+    Returns the versions applied by this call. Safe to run from several
+    workers at once: index creation is checkfirst and a version another worker
+    recorded first is skipped.
+    """
+    migration_metadata.create_all(engine, checkfirst=True)
+
+    applied = []
+    for version, name, step in MIGRATIONS:
+        with engine.begin() as conn:
+            if version in applied_versions(conn):
+                continue
+            step(conn)
+        try:
+            with engine.begin() as conn:
+                conn.execute(schema_migrations.insert().values(
+                    version=version, name=name, applied_at=datetime.now()
+                ))
+            applied.append(version)
+        except IntegrityError:
+            pass  # Recorded concurrently by another worker
+    return applied
+
+
+# ---------------------------------------
+# Query plan checks for the hot lookups
+# ---------------------------------------
+
+HOT_LOOKUPS: Dict[str, str] = {
+    "file_upload_log by File_Reference":
+        "SELECT id FROM file_upload_log WHERE File_Reference = :ref",
+    "flight_data by File_Reference":
+        "SELECT id, Seats FROM flight_data WHERE File_Reference = :ref",
+    "flight_data keyset page":
+        "SELECT id FROM flight_data WHERE File_Reference = :ref AND id > :after ORDER BY id LIMIT 100",
+}
+
+
+def lookup_uses_index(conn: Connection, sql: str) -> Tuple[bool, list]:
+    """
+    EXPLAIN a lookup and report whether it avoids a full table scan.
+    """
+    params = {"ref": "0", "after": 0}
+    if conn.dialect.name == "sqlite":
+        plan = [tuple(row) for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params)]
+        details = [str(row[-1]) for row in plan]
+        return all(not detail.startswith("SCAN") for detail in details), plan
+
+    plan = [dict(row._mapping) for row in conn.execute(text(f"EXPLAIN {sql}"), params)]
+    return all(row.get("type") != "ALL" and row.get("key") for row in plan), plan
+
+
+def check_query_plans(engine: Engine) -> Dict[str, dict]:
+    with engine.connect() as conn:
+        report = {}
+        for name, sql in HOT_LOOKUPS.items():
+            uses_index, plan = lookup_uses_index(conn, sql)
+            report[name] = {"uses_index": uses_index, "plan": plan}
+        return report
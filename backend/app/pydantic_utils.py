@@ -1,22 +1,23 @@
 from pydantic import BaseModel, create_model
 from sqlalchemy.orm import DeclarativeMeta
 from typing import Any, Dict
-import inflect
 
-inflector = inflect.engine()
+from .schema_registry import get_registry
 
 def table_to_pydantic(table_name: str, engine) -> type[BaseModel]:
-    from sqlalchemy import MetaData, Table
-    from sqlalchemy.orm import registry
+    from sqlalchemy.exc import NoSuchTableError
 
-    metadata = MetaData()
-    metadata.reflect(bind=engine)
-
-    if table_name not in metadata.tables:
+    try:
+        return get_registry(engine).get_model(table_name, "pydantic", _build_model)
+    except NoSuchTableError:
         raise ValueError(f"Table '{table_name}' not found in database")
 
-    table: Table = metadata.tables[table_name]
-    model_name = inflector.camelize(table_name)
+
+def _build_model(table) -> type[BaseModel]:
+    import inflect  # slow to import; only needed the first time a table's model is built
+
+    table_name = table.name
+    model_name = inflect.engine().camelize(table_name)
 
     fields: Dict[str, tuple[type, Any]] = {}
 
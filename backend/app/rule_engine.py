@@ -0,0 +1,608 @@
+import ast
+import json
+import operator
+import os
+import re
+from decimal import Decimal
+from functools import lru_cache
+from graphlib import CycleError, TopologicalSorter
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import Integer, Numeric, String, Table, and_, func, literal, not_, or_
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+
+# Compiled rules kept in memory, keyed by (rule id, equation text)
+RULE_CACHE_SIZE = int(os.getenv("RULE_CACHE_SIZE", "256"))
+
+
+# ---------------------------------------
+# Restricted equation grammar
+# ---------------------------------------
+
+class RuleValidationError(ValueError):
+    pass
+
+
+# Arithmetic and comparisons over columns and literals; no calls, attributes,
+# subscripts, lambdas or comprehensions
+ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.UAdd, ast.USub,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+)
+
+
+def parse_equation(equation: str, columns: Optional[Iterable[str]] = None) -> ast.Expression:
+    """
+    Parse an equation and check it only uses the restricted grammar.
+
+    When `columns` is given every name in the equation must be one of them.
+    Raises RuleValidationError describing the first problem found.
+    """
+    try:
+        tree = ast.parse(equation.strip(), mode="eval")
+    except SyntaxError as e:
+        raise RuleValidationError(f"Syntax error: {e.msg}")
+
+    known = set(columns) if columns is not None else None
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise RuleValidationError(f"'{type(node).__name__}' is not allowed in an equation")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, str)):
+            raise RuleValidationError(f"Constant {node.value!r} is not allowed in an equation")
+        if isinstance(node, ast.Name) and known is not None and node.id not in known:
+            raise RuleValidationError(f"Unknown column '{node.id}'")
+    return tree
+
+
+def equation_columns(tree: ast.Expression) -> List[str]:
+    # Column names in order of first appearance
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id not in names:
+            names.append(node.id)
+    return names
+
+
+# ---------------------------------------
+# Compiled, column-wise rule evaluation
+# ---------------------------------------
+
+class CompiledRule:
+    """
+    A MathRule equation compiled once and evaluated over whole columns.
+
+    The equation runs against pandas Series instead of one row dict at a time.
+    Rows the vectorized pass cannot reproduce exactly (NULL inputs, Decimal/float
+    mixes, division by zero, ...) are re-evaluated one by one with the same code
+    object, so the results match the original per-row `eval` loop.
+    """
+
+    def __init__(self, equation: str, columns: Optional[Iterable[str]] = None):
+        self.equation = equation
+        self.tree = parse_equation(equation, columns)
+        self.code = compile(self.tree, "<rule>", "eval")
+        self.columns = equation_columns(self.tree)
+        self.names = set(self.columns)
+
+    def evaluate_row(self, row: Dict[str, Any]) -> Any:
+        return eval(self.code, {"__builtins__": {}}, row)
+
+    def evaluate(self, frame: "pd.DataFrame") -> "pd.Series":
+        """
+        Evaluate the equation for every row of `frame` (one column per selected column).
+
+        Returns a Series indexed like `frame` holding the result of every row that
+        evaluated successfully; rows whose per-row eval would raise are left out.
+        """
+        import pandas as pd
+
+        if frame.empty:
+            return pd.Series(dtype=object)
+
+        used = [col for col in frame.columns if col in self.names]
+        complete = frame[used].notna().all(axis=1)
+        dense = _typed_columns(frame.loc[complete, used])
+        if not _int64_safe(self.tree.body, dense):
+            # Some int64 intermediate could wrap around: use Python ints, like the row loop
+            dense = dense.astype({col: object for col in dense.columns if dense[col].dtype.kind in "iu"})
+
+        results: Dict[Any, Any] = {}
+        retry = frame.index[~complete]
+
+        values = self._evaluate_columns(dense) if len(dense) else None
+        if values is not None:
+            finite = _finite(values)
+            if not finite.all():
+                # x / 0 and friends: leave those rows to the row loop and redo the
+                # rest, so integer results are not promoted to float by the inf/NaN
+                retry = retry.union(dense.index[~finite], sort=False)
+                dense = dense[finite]
+                values = self._evaluate_columns(dense) if len(dense) else None
+        if values is None and len(dense):
+            # Mixed types the column pass rejects: fall back to the row loop
+            retry = frame.index
+        elif values is not None:
+            finite = _finite(values)
+            results.update(zip(values.index[finite], values[finite].tolist()))
+            retry = retry.union(values.index[~finite], sort=False)
+
+        if len(retry):
+            columns = list(frame.columns)
+            rows = frame.loc[retry].itertuples(index=False, name=None)
+            for idx, row in zip(retry, rows):
+                try:
+                    results[idx] = self.evaluate_row(dict(zip(columns, row)))
+                except Exception:
+                    results.pop(idx, None)  # Same as the old loop: skip the row
+
+        order = [idx for idx in frame.index if idx in results]
+        return pd.Series([results[idx] for idx in order], index=order, dtype=object)
+
+    def _evaluate_columns(self, dense: "pd.DataFrame") -> Optional["pd.Series"]:
+        import pandas as pd
+
+        namespace = {col: dense[col] for col in dense.columns}
+        try:
+            value = eval(self.code, {"__builtins__": {}}, namespace)
+        except Exception:
+            return None
+
+        if not isinstance(value, pd.Series):
+            # Constant equation (e.g. "100"): every row gets the same value
+            return pd.Series([value] * len(dense), index=dense.index, dtype=object)
+        if not value.index.equals(dense.index):
+            return None
+        return value
+
+
+def _typed_columns(frame: "pd.DataFrame") -> "pd.DataFrame":
+    # Numeric dtypes for the column pass, except object columns mixing ints and floats:
+    # as float64 their ints would come back as 3.0 where the row loop gives 3
+    typed = frame.infer_objects()
+    for col in frame.columns:
+        if typed[col].dtype.kind == "f" and frame[col].dtype == object:
+            if not all(isinstance(value, float) for value in frame[col]):
+                typed[col] = frame[col]
+    return typed
+
+
+# int64 results must stay strictly inside this bound
+INT64_LIMIT = 2 ** 63
+
+
+def _int64_safe(node, dense: "pd.DataFrame") -> bool:
+    """
+    Whether evaluating `node` over `dense` can overflow int64, which numpy does silently.
+
+    Bounds the magnitude of every integer intermediate from the largest absolute
+    value of each integer column. Float intermediates overflow to inf, which the
+    caller already sends to the row loop, and object columns use Python numbers.
+    """
+    def bound(node):
+        # (kind, largest possible magnitude) with kind "int", "float" or "other"
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                return "other", 0
+            return ("int", abs(node.value)) if isinstance(node.value, int) else ("float", 0)
+        if isinstance(node, ast.Name):
+            values = dense[node.id]
+            if values.dtype.kind in "iu":
+                return "int", max(abs(int(values.min())), abs(int(values.max()))) if len(values) else 0
+            return ("float", 0) if values.dtype.kind == "f" else ("other", 0)
+        if isinstance(node, ast.UnaryOp):
+            return bound(node.operand)
+        if isinstance(node, ast.Compare):
+            for operand in [node.left] + node.comparators:
+                bound(operand)
+            return "int", 1
+        left_kind, left = bound(node.left)
+        right_kind, right = bound(node.right)
+        if "other" in (left_kind, right_kind):
+            return "other", 0
+        if "float" in (left_kind, right_kind) or isinstance(node.op, ast.Div):
+            return "float", 0
+        if isinstance(node.op, (ast.Add, ast.Sub)):
+            result = left + right
+        elif isinstance(node.op, ast.Mult):
+            result = left * right
+        elif isinstance(node.op, ast.Pow):
+            # Exponents past 64 wrap for any base above 1; don't build the huge power
+            result = left ** right if left <= 1 or right < 64 else INT64_LIMIT
+        elif isinstance(node.op, ast.FloorDiv):
+            result = left + 1  # min // -1
+        else:
+            result = right
+        if result >= INT64_LIMIT:
+            raise OverflowError
+        return "int", result
+
+    try:
+        kind, result = bound(node)
+    except OverflowError:
+        return False
+    return result < INT64_LIMIT
+
+
+def _finite(values: "pd.Series") -> "np.ndarray":
+    import numpy as np
+    import pandas as pd
+
+    # Float results of x / 0 come back as inf/NaN instead of raising ZeroDivisionError
+    if pd.api.types.is_float_dtype(values.dtype):
+        return np.isfinite(values.to_numpy(dtype=float, na_value=np.nan))
+    return values.notna().to_numpy()
+
+
+def compile_rule(equation: str, columns: Optional[Iterable[str]] = None) -> CompiledRule:
+    return CompiledRule(equation, columns)
+
+
+@lru_cache(maxsize=RULE_CACHE_SIZE)
+def _compiled_rule(rule_id: int, equation: str) -> CompiledRule:
+    return CompiledRule(equation)
+
+
+def get_compiled_rule(rule) -> CompiledRule:
+    """
+    Compiled form of a MathRule row, parsed once per rule id and equation.
+
+    The equation text is part of the key, so an edited rule is recompiled.
+    """
+    return _compiled_rule(rule.id, rule.equation)
+
+
+def format_selcols(columns: List[str]) -> str:
+    return "".join(f"|{col}|" for col in columns)
+
+
+def parse_selcols(selcols: str) -> List[str]:
+    # Stored as "|Col_A||Col_B|"
+    return [col for col in selcols.strip('|').split('||') if col]
+
+
+# ---------------------------------------
+# Ordering a set of rules by their columns
+# ---------------------------------------
+
+class RuleGraphError(ValueError):
+    pass
+
+
+def order_rules(rules: list) -> list:
+    """
+    Sort MathRule rows so every rule runs after the rules producing its inputs.
+
+    Rule B depends on rule A when A's target_column is one of B's selcols or
+    a column B's conditions filter on. Raises RuleGraphError for two rules writing the same column or a cycle.
+    """
+    producers = {}
+    for rule in rules:
+        if rule.target_column in producers:
+            raise RuleGraphError(
+                f"Rules {producers[rule.target_column].id} and {rule.id} both write '{rule.target_column}'"
+            )
+        producers[rule.target_column] = rule
+
+    sorter = TopologicalSorter()
+    for rule in rules:
+        columns = parse_selcols(rule.selcols) + condition_columns(rule.conditions)
+        inputs = [producers[col].id for col in columns
+                  if col in producers and producers[col] is not rule]
+        sorter.add(rule.id, *inputs)
+
+    by_id = {rule.id: rule for rule in rules}
+    try:
+        return [by_id[rule_id] for rule_id in sorter.static_order()]
+    except CycleError as e:
+        raise RuleGraphError(f"Rules depend on each other in a cycle: {e.args[1]}")
+
+
+# ---------------------------------------
+# SQL push-down of plain arithmetic rules
+# ---------------------------------------
+
+# Operators whose SQL result matches Python's exactly for non-NULL numeric inputs.
+# Division is left out: MySQL rounds intermediate quotients (div_precision_increment).
+PUSHDOWN_BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+}
+PUSHDOWN_UNARY_OPS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+
+def to_sql_expression(compiled: CompiledRule, table: Table):
+    """
+    Translate a rule into a SQL expression over `table`, or return None.
+
+    Only +, -, * and unary signs over numeric columns and numeric literals are
+    translated. Float literals are refused next to Decimal columns, because
+    Python raises on Decimal * float and would skip those rows. The caller must
+    also filter out rows with NULL inputs, which the Python path skips.
+    """
+    has_decimal = any(
+        col in table.c and isinstance(table.c[col].type, Numeric) and table.c[col].type.asdecimal
+        for col in compiled.columns
+    )
+
+    def convert(node):
+        if isinstance(node, ast.Expression):
+            return convert(node.body)
+        if isinstance(node, ast.BinOp) and type(node.op) in PUSHDOWN_BINARY_OPS:
+            left, right = convert(node.left), convert(node.right)
+            if left is None or right is None:
+                return None
+            return PUSHDOWN_BINARY_OPS[type(node.op)](left, right)
+        if isinstance(node, ast.UnaryOp) and type(node.op) in PUSHDOWN_UNARY_OPS:
+            operand = convert(node.operand)
+            return None if operand is None else PUSHDOWN_UNARY_OPS[type(node.op)](operand)
+        if isinstance(node, ast.Name):
+            column = table.c.get(node.id)
+            if column is None or not isinstance(column.type, (Integer, Numeric)):
+                return None
+            return column
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            if isinstance(node.value, float) and has_decimal:
+                return None
+            return literal(node.value)
+        return None
+
+    return convert(compiled.tree)
+
+
+# ---------------------------------------
+# Rule conditions (row filters)
+# ---------------------------------------
+
+# Operators the rule editor stores in its JSON conditions
+CONDITION_OPERATORS = {
+    "equals": "==",
+    "not_equals": "!=",
+    "greater_than": ">",
+    "less_than": "<",
+}
+
+CONDITION_TOKEN_PATTERN = re.compile(
+    r"\s*(?:('(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\")|(-?\d+(?:\.\d+)?)|([A-Za-z_]\w*)|(<=|>=|<>|!=|=|<|>|\(|\)))"
+)
+
+# Backslash escapes inside quoted condition values, as MySQL reads them
+SQL_STRING_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "0": "\0"}
+
+SQL_KEYWORDS = {"and": "and", "or": "or", "not": "not", "is": "is", "null": "None"}
+
+COMPARE_SQL = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne,
+    ast.Lt: operator.lt, ast.LtE: operator.le,
+    ast.Gt: operator.gt, ast.GtE: operator.ge,
+}
+
+FLIPPED_COMPARE = {ast.Lt: ast.Gt(), ast.Gt: ast.Lt(), ast.LtE: ast.GtE(), ast.GtE: ast.LtE()}
+
+
+def _sql_string(token: str) -> str:
+    # 'O''Hare' or 'O\'Hare'  ->  "O'Hare" as a Python literal
+    quote = token[0]
+    body = re.sub(
+        r"\\(.)|" + quote * 2,
+        lambda m: SQL_STRING_ESCAPES.get(m.group(1), m.group(1)) if m.group(1) is not None else quote,
+        token[1:-1],
+        flags=re.S,
+    )
+    return repr(body)
+
+
+def _sql_text_to_python(conditions: str) -> str:
+    # Marketing_Airline = 'DL' AND DOM_INT <> 'INT'  ->  Marketing_Airline == 'DL' and DOM_INT != 'INT'
+    parts = []
+    previous_string = False
+    position = 0
+    conditions = conditions.strip()
+    while position < len(conditions):
+        match = CONDITION_TOKEN_PATTERN.match(conditions, position)
+        if not match or match.end() == position:
+            raise RuleValidationError(f"Cannot parse conditions near '{conditions[position:position + 20]}'")
+        string, number, word, symbol = match.groups()
+        if word is not None:
+            parts.append(SQL_KEYWORDS.get(word.lower(), word))
+        elif symbol is not None:
+            parts.append({"=": "==", "<>": "!="}.get(symbol, symbol))
+        elif string is not None:
+            # Python would join two adjacent literals into one value; SQL has no such thing
+            if previous_string:
+                raise RuleValidationError(f"Unexpected string near '{conditions[position:position + 20]}'")
+            parts.append(_sql_string(string))
+        else:
+            parts.append(number)
+        previous_string = string is not None
+        position = match.end()
+    return " ".join(parts)
+
+
+def _json_to_python(items: list) -> str:
+    # [{"column": "DOM_INT", "operator": "equals", "value": "DOM"}, ...] joined with AND
+    clauses = []
+    for item in items:
+        column = (item.get("column") or "").strip()
+        if not column:
+            continue  # The editor's empty placeholder row
+        op = item.get("operator", "equals")
+        value = item.get("value", "")
+        if op == "contains":
+            clauses.append(f"{str(value)!r} in {column}")
+        elif op in CONDITION_OPERATORS:
+            clauses.append(f"{column} {CONDITION_OPERATORS[op]} {str(value)!r}")
+        else:
+            raise RuleValidationError(f"Unknown condition operator '{op}'")
+    return " and ".join(f"({clause})" for clause in clauses)
+
+
+class RuleCondition:
+    """
+    A rule's conditions compiled against the flight_data table.
+
+    to_sql() gives a WHERE clause so only matching rows are fetched and
+    updated; mask() applies the same filter to a DataFrame already in memory.
+    A comparison against NULL is false in both, so NOT gives the same rows too.
+    Text columns compare case-insensitively in both, as under MySQL's default
+    collations, whatever the column's actual collation.
+    """
+
+    def __init__(self, tree: ast.Expression, table: Table):
+        self.tree = tree
+        self.table = table
+        self.columns = equation_columns(tree)
+        self._check(tree.body)
+
+    def _check(self, node):
+        if isinstance(node, ast.BoolOp):
+            for value in node.values:
+                self._check(value)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            self._check(node.operand)
+        else:
+            self._comparison(node)
+
+    def _comparison(self, node):
+        # Normalised to (column, op, literal); the literal is coerced to the column's type
+        if not isinstance(node, ast.Compare) or len(node.ops) != 1:
+            raise RuleValidationError("Conditions must compare a column with a value")
+        left, op, right = _fold_sign(node.left), node.ops[0], _fold_sign(node.comparators[0])
+        if isinstance(op, ast.In):
+            left, right = right, left  # 'x' in Column
+        elif isinstance(right, ast.Name) and isinstance(left, ast.Constant):
+            left, right = right, left
+            op = FLIPPED_COMPARE.get(type(op), op)
+        if not isinstance(left, ast.Name) or not isinstance(right, ast.Constant):
+            raise RuleValidationError("Conditions must compare a column with a value")
+        if left.id not in self.table.c:
+            raise RuleValidationError(f"Unknown column '{left.id}'")
+        column = self.table.c[left.id]
+
+        if isinstance(op, (ast.Is, ast.IsNot)):
+            if right.value is not None:
+                raise RuleValidationError("IS only compares with NULL")
+            return column, op, None
+        if not isinstance(op, (ast.In, *COMPARE_SQL)):
+            raise RuleValidationError(f"Operator '{type(op).__name__}' is not allowed in conditions")
+        return column, op, _coerce(column, right.value) if not isinstance(op, ast.In) else str(right.value)
+
+    def to_sql(self):
+        def convert(node):
+            if isinstance(node, ast.BoolOp):
+                combine = and_ if isinstance(node.op, ast.And) else or_
+                return combine(*(convert(value) for value in node.values))
+            if isinstance(node, ast.UnaryOp):
+                return not_(convert(node.operand))
+            column, op, value = self._comparison(node)
+            if isinstance(op, ast.Is):
+                return column.is_(None)
+            if isinstance(op, ast.IsNot):
+                return column.isnot(None)
+            present = column.isnot(None)
+            if isinstance(column.type, String):
+                column, value = func.lower(column), value.lower()
+            if isinstance(op, ast.In):
+                return column.contains(value, autoescape=True)
+            # Two-valued like mask(): a NULL column makes the comparison false, not unknown
+            return and_(present, COMPARE_SQL[type(op)](column, value))
+        return convert(self.tree.body)
+
+    def mask(self, frame: "pd.DataFrame") -> "pd.Series":
+        import pandas as pd
+
+        def convert(node) -> "pd.Series":
+            if isinstance(node, ast.BoolOp):
+                masks = [convert(value) for value in node.values]
+                combined = masks[0]
+                for other in masks[1:]:
+                    combined = combined & other if isinstance(node.op, ast.And) else combined | other
+                return combined
+            if isinstance(node, ast.UnaryOp):
+                return ~convert(node.operand)
+            column, op, value = self._comparison(node)
+            values = frame[column.name]
+            present = values.notna()
+            if isinstance(op, ast.Is):
+                return ~present
+            if isinstance(op, ast.IsNot):
+                return present
+            result = pd.Series(False, index=frame.index)
+            values = values[present]
+            if isinstance(column.type, String):
+                values, value = values.astype(str).str.lower(), value.lower()
+            if isinstance(op, ast.In):
+                result[present] = values.astype(str).str.contains(value, regex=False)
+            else:
+                result[present] = COMPARE_SQL[type(op)](values, value).astype(bool)
+            return result
+        return convert(self.tree.body)
+
+
+def _fold_sign(node):
+    # -1 parses as USub applied to 1; conditions compare with the literal -1
+    if (isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd))
+            and isinstance(node.operand, ast.Constant) and type(node.operand.value) in (int, float)):
+        value = node.operand.value
+        return ast.Constant(-value if isinstance(node.op, ast.USub) else value)
+    return node
+
+
+def _coerce(column, value):
+    if value is None or isinstance(column.type, String):
+        return value if value is None else str(value)
+    try:
+        if isinstance(column.type, Integer):
+            number = float(value)
+            return int(number) if number.is_integer() else number
+        if isinstance(column.type, Numeric):
+            return Decimal(str(value)) if column.type.asdecimal else float(value)
+    except (TypeError, ValueError, ArithmeticError):
+        raise RuleValidationError(f"'{value}' is not a valid value for column '{column.name}'")
+    return value
+
+
+def _conditions_tree(conditions: Optional[str]) -> Optional[ast.Expression]:
+    if not conditions or not conditions.strip():
+        return None
+    try:
+        parsed = json.loads(conditions)
+    except ValueError:
+        source = _sql_text_to_python(conditions)
+    else:
+        if not isinstance(parsed, list):
+            raise RuleValidationError("Conditions must be a list or a SQL-style expression")
+        source = _json_to_python(parsed)
+    if not source:
+        return None
+
+    try:
+        return ast.parse(source, mode="eval")
+    except SyntaxError as e:
+        raise RuleValidationError(f"Syntax error in conditions: {e.msg}")
+
+
+def condition_columns(conditions: Optional[str]) -> List[str]:
+    # Columns the conditions read, without checking them against a table
+    tree = _conditions_tree(conditions)
+    return equation_columns(tree) if tree is not None else []
+
+
+def compile_conditions(conditions: Optional[str], table: Table) -> Optional[RuleCondition]:
+    """
+    Parse MathRule.conditions, either the rule editor's JSON list or SQL-style
+    text such as "Marketing_Airline = 'DL' AND DOM_INT = 'DOM'".
+
+    Returns None when there is nothing to filter on.
+    """
+    tree = _conditions_tree(conditions)
+    return RuleCondition(tree, table) if tree is not None else None
@@ -0,0 +1,206 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Literal, Optional
+
+from sqlalchemy.orm import Session
+
+from . import crud, database, fingerprints, rule_engine, snapshots
+from .models import MathRule
+from .schema_registry import get_registry
+
+# Processes evaluating a rule over many files at once; one file per process at a time
+RULE_WORKERS = int(os.getenv("RULE_WORKERS", str(os.cpu_count() or 1)))
+
+# "auto" pushes plain arithmetic down to SQL, "sql" requires that, "python" never does it
+RuleMode = Literal["auto", "sql", "python"]
+
+
+class RuleRunError(Exception):
+    """
+    A rule could not run for a file; carries the HTTP status to report.
+    """
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+# ---------------------------------------
+# One rule over one file
+# ---------------------------------------
+
+def run_rule(db: Session, rule, file_reference: str, mode: RuleMode = "auto", force: bool = False) -> Dict[str, Any]:
+    """
+    Evaluate `rule` over every row of one file and write its target column back.
+
+    Keeps the file's snapshot and stored fingerprints in step with the write;
+    the caller invalidates in-process caches and records metrics from the
+    returned "mode", "rows_evaluated" and "rows_written".
+    """
+    try:
+        selcols = rule_engine.parse_selcols(rule.selcols)
+        compiled = rule_engine.get_compiled_rule(rule)
+        target_col = rule.target_column
+        table = get_registry(database.engine).get_table("flight_data")
+        condition = rule_engine.compile_conditions(rule.conditions, table)
+        where = condition.to_sql() if condition is not None else None
+    except Exception as e:
+        raise RuleRunError(400, f"Invalid rule format: {e}")
+
+    # Plain arithmetic rules run as one set-based UPDATE inside the database
+    sql_expression = None
+    if mode != "python":
+        if target_col in table.c:
+            sql_expression = rule_engine.to_sql_expression(compiled, table)
+        if sql_expression is None and mode == "sql":
+            raise RuleRunError(400, "Rule cannot be pushed down to SQL")
+
+    if sql_expression is not None:
+        # The file's snapshot is set aside during the write and re-synced from the table after it
+        with snapshots.write_back(db, file_reference, [target_col]):
+            write_started = time.perf_counter()
+            rows_written = crud.update_file_with_expression(
+                db, file_reference, target_col, sql_expression, compiled.columns, where
+            )
+            fingerprints.clear_fingerprints(db, file_reference, [target_col])
+            db.commit()
+            write_seconds = time.perf_counter() - write_started
+        return {
+            "message": f"Rule '{rule.rule_name}' executed for {rows_written} rows",
+            "mode": "sql",
+            "results": [],
+            "target_column": target_col,
+            "rows_evaluated": rows_written,
+            "rows_written": rows_written,
+            "write_seconds": round(write_seconds, 4),
+            "rows_per_second": round(rows_written / write_seconds) if write_seconds else rows_written
+        }
+
+    # Fetch the rows matching the rule's conditions, with id and selected columns
+    frame = crud.load_rule_frame(db, file_reference, selcols, where)
+
+    if frame.empty and condition is None:
+        raise RuleRunError(404, "No rows in flight_data")
+
+    # Fingerprint the inputs in fixed chunks of id order; only chunks whose
+    # inputs or rule changed since the last run are recomputed and written
+    frame = frame.sort_values("id", kind="stable").reset_index(drop=True)
+    chunk_rows = fingerprints.FINGERPRINT_CHUNK_ROWS
+    current = fingerprints.chunk_fingerprints(fingerprints.rule_signature(rule), frame, chunk_rows)
+    stored = {} if force else fingerprints.load_fingerprints(db, file_reference, target_col)
+    dirty = [i for i, fingerprint in enumerate(current) if stored.get(i) != fingerprint]
+
+    row_ids = frame.pop("id")
+    inputs = frame[(frame.index // chunk_rows).isin(dirty)]
+
+    # Evaluate the equation over whole columns at once
+    computed = compiled.evaluate(inputs)
+
+    # Write the results back in a few set-based statements, with the new fingerprints
+    rows_written, write_seconds = 0, 0.0
+    if dirty or len(stored) != len(current):
+        with snapshots.write_back(db, file_reference, [target_col]):
+            write_started = time.perf_counter()
+            rows_written = crud.bulk_update_column(
+                db, target_col, list(zip(row_ids.loc[computed.index].tolist(), computed.tolist()))
+            )
+            fingerprints.save_fingerprints(db, file_reference, target_col, current, dirty)
+            db.commit()
+            write_seconds = time.perf_counter() - write_started
+
+    results = [
+        {
+            "row_id": row_ids[idx],
+            "used_values": inputs.loc[idx].to_dict(),
+            "result": result
+        }
+        for idx, result in computed.head(10).items()
+    ]
+
+    return {
+        "message": f"Rule '{rule.rule_name}' executed for {len(computed)} rows",
+        "mode": "python",
+        "results": results,  # Top 10 results for preview
+        "target_column": target_col,
+        "rows_evaluated": len(inputs),
+        "rows_written": rows_written,
+        "chunks_total": len(current),
+        "chunks_skipped": len(current) - len(dirty),
+        "rows_skipped": len(frame) - len(inputs),
+        "write_seconds": round(write_seconds, 4),
+        "rows_per_second": round(rows_written / write_seconds) if write_seconds else rows_written
+    }
+
+
+# ---------------------------------------
+# One rule over many files, in worker processes
+# ---------------------------------------
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    # Spawned rather than forked: the server process has threads and open pooled connections,
+    # so each worker imports the app afresh and builds its own engine
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=RULE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def run_partition(rule_id: int, file_reference: str, mode: RuleMode, force: bool) -> Dict[str, Any]:
+    """
+    Worker entry point: run one rule over one file with the worker's own session.
+
+    Errors are returned rather than raised so one bad file does not fail the batch.
+    """
+    started = time.perf_counter()
+    summary = {"file_reference": file_reference}
+    db = database.SessionLocal()
+    try:
+        rule = db.query(MathRule).filter(MathRule.id == rule_id).first()
+        if rule is None:
+            raise RuleRunError(404, "Rule not found")
+        result = run_rule(db, rule, file_reference, mode, force)
+        result.pop("results")
+        result.pop("message")
+        summary.update(result)
+        summary["status"] = "completed"
+    except RuleRunError as e:
+        db.rollback()
+        summary.update({"status": "failed", "status_code": e.status_code, "error": e.detail})
+    except Exception as e:
+        db.rollback()
+        summary.update({"status": "failed", "status_code": 500, "error": str(e)})
+    finally:
+        db.close()
+    summary["seconds"] = round(time.perf_counter() - started, 4)
+    return summary
+
+
+def run_rule_batch(rule_id: int, file_references: List[str], mode: RuleMode = "auto", force: bool = False) -> List[Dict[str, Any]]:
+    """
+    Run one rule over every file in the worker processes; one result per entry of `file_references`.
+
+    Each distinct File_Reference is one partition, so no two workers of the
+    batch write the same rows. Writes from outside the batch (/execute-rule in
+    this or another server process) are ordered by snapshots.write_back's file
+    lock and data version, the same as between requests.
+    """
+    pool = get_pool()
+    partitions = {ref: pool.submit(run_partition, rule_id, ref, mode, force) for ref in dict.fromkeys(file_references)}
+    return [dict(partitions[ref].result()) for ref in file_references]
@@ -0,0 +1,148 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Set
+
+from sqlalchemy import MetaData, Table
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.declarative import declarative_base
+from starlette.concurrency import run_in_threadpool
+
+from .database import engine as default_engine
+
+# Seconds a reflected table stays cached; 0 keeps it until invalidate() is called
+SCHEMA_CACHE_TTL = float(os.getenv("SCHEMA_CACHE_TTL", "300"))
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------
+# Process-wide cache of reflected tables
+# ---------------------------------------
+
+class _Entry:
+    def __init__(self, table: Table):
+        self.table = table
+        self.models: Dict[str, Any] = {}
+        self.loaded_at = time.monotonic()
+
+
+class SchemaRegistry:
+    """
+    Reflects each table once and hands out the cached Table plus any models
+    built from it (ORM classes, Pydantic schemas, ...).
+
+    Entries expire after `ttl` seconds or when invalidate() is called. An
+    expired entry is still served while a background thread reflects the
+    table again; only a table with no entry (first use, after invalidate())
+    is reflected by the caller. Async code calls get_table_async() so that
+    reflection runs in the threadpool rather than on the event loop.
+    """
+
+    def __init__(self, engine: Engine, ttl: float = SCHEMA_CACHE_TTL):
+        self.engine = engine
+        self.ttl = ttl
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.RLock()  # Held while a missing table is reflected
+        self._refresh_lock = threading.Lock()  # Never held across database calls
+        self._refreshing: Set[str] = set()
+        self._generation = 0  # Bumped by invalidate(); a refresh started before it is dropped
+        # Lookups served from the cache vs. ones that had to reflect; read by /metrics
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, table_name: str) -> Optional[_Entry]:
+        # Does not wait on a reflection in progress; an expired entry is returned and refreshed behind it
+        entry = self._entries.get(table_name)
+        if entry is None:
+            return None
+        self.hits += 1
+        if self._expired(entry):
+            with self._refresh_lock:
+                if table_name in self._refreshing:
+                    return entry
+                self._refreshing.add(table_name)
+            threading.Thread(
+                target=self._refresh, args=(table_name, self._generation), name=f"reflect-{table_name}", daemon=True
+            ).start()
+        return entry
+
+    def _entry(self, table_name: str) -> _Entry:
+        entry = self._cached(table_name)
+        if entry is not None:
+            return entry
+        with self._lock:
+            entry = self._entries.get(table_name)  # Reflected by another thread while this one waited
+            if entry is None:
+                self.misses += 1
+                entry = _Entry(self._reflect(table_name))
+                self._entries[table_name] = entry
+            return entry
+
+    def _reflect(self, table_name: str) -> Table:
+        # Reflect just this table, into its own MetaData so a refresh starts clean.
+        # Raises sqlalchemy.exc.NoSuchTableError if the table does not exist.
+        return Table(table_name, MetaData(), autoload_with=self.engine)
+
+    def _refresh(self, table_name: str, generation: int):
+        try:
+            table = self._reflect(table_name)
+        except Exception:
+            logger.exception("Could not refresh the reflection of %s; serving the cached one", table_name)
+            table = None
+        with self._refresh_lock:
+            self._refreshing.discard(table_name)
+            if table is not None and generation == self._generation:
+                self.misses += 1
+                self._entries[table_name] = _Entry(table)
+
+    def _expired(self, entry: _Entry) -> bool:
+        return self.ttl > 0 and time.monotonic() - entry.loaded_at > self.ttl
+
+    def get_table(self, table_name: str) -> Table:
+        return self._entry(table_name).table
+
+    async def get_table_async(self, table_name: str) -> Table:
+        entry = self._cached(table_name)
+        if entry is not None:
+            return entry.table
+        return await run_in_threadpool(self.get_table, table_name)
+
+    def get_model(self, table_name: str, kind: str, builder: Callable[[Table], Any]) -> Any:
+        """
+        Return the model of type `kind` for a table, building it with `builder` on first use.
+        """
+        with self._lock:
+            entry = self._entry(table_name)
+            if kind not in entry.models:
+                entry.models[kind] = builder(entry.table)
+            return entry.models[kind]
+
+    def get_orm_model(self, table_name: str):
+        return self.get_model(table_name, "orm", _build_orm_model)
+
+    def invalidate(self, table_name: Optional[str] = None):
+        with self._lock, self._refresh_lock:
+            self._generation += 1
+            if table_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(table_name, None)
+
+
+def _build_orm_model(table: Table):
+    # A fresh declarative base per reflection, so a refreshed table can be mapped again
+    return type(table.name.capitalize(), (declarative_base(),), {'__table__': table})
+
+
+_registries: Dict[Engine, SchemaRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(engine: Optional[Engine] = None) -> SchemaRegistry:
+    engine = engine if engine is not None else default_engine
+    with _registries_lock:
+        if engine not in _registries:
+            _registries[engine] = SchemaRegistry(engine)
+        return _registries[engine]
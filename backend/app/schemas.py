@@ -1,9 +1,10 @@
-from pydantic import BaseModel, create_model
+from pydantic import BaseModel, ConfigDict, create_model
 from datetime import datetime
 from typing import Optional, List
-from sqlalchemy import MetaData, Table
+from sqlalchemy import Table
 from sqlalchemy.engine import Engine
 from .database import engine
+from .schema_registry import get_registry
 
 
 # Static schema for FileUploadLog
@@ -41,10 +42,12 @@ class FileDetailsSchema(BaseModel):
 
 # Function to dynamically generate Pydantic model from SQLAlchemy table
 def table_to_pydantic(table_name: str, engine: Engine):
-    metadata = MetaData()
-    metadata.reflect(bind=engine)
-    table = Table(table_name, metadata, autoload_with=engine)
+    # Built once per reflected table and cached by the schema registry
+    return get_registry(engine).get_model(table_name, "schema", _build_table_schema)
 
+
+def _build_table_schema(table: Table):
+    table_name = table.name
     fields = {}
     for col in table.columns:
         try:
@@ -55,12 +58,9 @@ def table_to_pydantic(table_name: str, engine: Engine):
         fields[col.name] = (Optional[col_type] if col.nullable else col_type, default)
 
     # Create dynamic Pydantic model with ORM support
-    class Config:
-        from_attributes = True  # To use from_orm() properly
-
     return create_model(
         f"{table_name.capitalize()}Schema",
-        __config__=Config,
+        __config__=ConfigDict(from_attributes=True),  # To use from_orm() properly
         **fields
     )
 
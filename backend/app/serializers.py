@@ -0,0 +1,50 @@
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Sequence
+
+from fastapi.responses import Response
+
+
+# ---------------------------------------
+# Direct row -> JSON encoding
+# ---------------------------------------
+
+def encode_value(value: Any) -> Any:
+    """
+    Encode the non-JSON types that come back from flight_data rows.
+
+    Decimals follow FastAPI's jsonable_encoder: whole values become int,
+    everything else float. Dates and times become ISO strings.
+    """
+    if isinstance(value, Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def rows_to_dicts(keys: Sequence[str], rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+    # Core result rows are plain tuples; zip them with the column names once per row
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def file_log_to_dict(file) -> Dict[str, Any]:
+    return {
+        "id": file.id,
+        "file_reference": file.file_reference,
+        "file_name": file.file_name,
+        "upload_timestamp": file.upload_timestamp,
+    }
+
+
+def dumps(payload: Any) -> str:
+    # json only calls encode_value for the Decimal/datetime values it can't encode itself
+    return json.dumps(payload, default=encode_value, separators=(",", ":"))
+
+
+def json_response(payload: Any) -> Response:
+    # Skip FastAPI's recursive jsonable_encoder pass over the payload
+    return Response(content=dumps(payload), media_type="application/json")
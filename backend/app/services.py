@@ -1,55 +1,293 @@
+import logging
 import os
+import re
+import uuid
 from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
 from fastapi import UploadFile
-import pandas as pd
+from sqlalchemy import String
 from sqlalchemy.orm import Session
-from . import database, models, crud
+from . import database, models, crud, metrics, aggregates, snapshots, content_hashes
+from .schema_registry import get_registry
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-UPLOAD_ALL_ROWS = False  # Set this to True to upload all rows, False to upload first 10 rows
+logger = logging.getLogger(__name__)
 
-def process_file_upload(file: UploadFile,db):
-    # Step 1: Generate file reference and save the file to disk
-    
-    file_reference = datetime.now().strftime("%Y%m%d%H%M%S")
+# Bytes copied from the upload to disk per read
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Characters replaced with underscores in column headers
+COLUMN_NAME_PATTERN = re.compile(r'[ \-\/\(\)=&]')
+
+
+def clean_column_name(name: Any) -> str:
+    return COLUMN_NAME_PATTERN.sub('_', str(name))
+
+
+def text_columns() -> set:
+    # flight_data columns stored as text; every reader hands their values over as str
+    table = get_registry(database.engine).get_table("flight_data")
+    return {col.name for col in table.columns if isinstance(col.type, String)}
+
+
+# Leading bytes used to recognise an upload when its extension is unknown
+ZIP_MAGIC = b"PK\x03\x04"  # .xlsx workbooks are zip archives
+PARQUET_MAGIC = b"PAR1"
+# OLE compound files: legacy .xls workbooks (and password-protected .xlsx), which openpyxl cannot read
+OLE_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+FILE_FORMATS_BY_EXTENSION = {
+    ".xlsx": "excel",
+    ".xlsm": "excel",
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+}
+
+
+class UnsupportedFileFormat(ValueError):
+    """
+    Raised for uploads no batch reader can parse, whatever their extension.
+    """
+
+
+def detect_file_format(file_location: str, ext: str) -> str:
+    with open(file_location, "rb") as f:
+        magic = f.read(len(OLE_MAGIC))
+    if magic == OLE_MAGIC:
+        raise UnsupportedFileFormat(
+            "Legacy .xls (or password-protected) workbooks are not supported; save the sheet as .xlsx or .csv"
+        )
+
+    file_format = FILE_FORMATS_BY_EXTENSION.get(ext.lower())
+    if file_format:
+        return file_format
+    if magic.startswith(ZIP_MAGIC):
+        return "excel"
+    if magic.startswith(PARQUET_MAGIC):
+        return "parquet"
+    return "csv"
+
+
+def check_upload_format(file_location: str, ext: str) -> str:
+    # Checked before the upload is claimed or queued; an unsupported file is removed from disk
+    try:
+        return detect_file_format(file_location, ext)
+    except UnsupportedFileFormat:
+        os.remove(file_location)
+        raise
+
+
+def iter_excel_batches(file_location: str, chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield lists of worksheet rows as dicts keyed by the cleaned header names.
+
+    The workbook is opened in read-only mode, so openpyxl streams rows from
+    the file instead of building the whole sheet in memory.
+    """
+    from openpyxl import load_workbook
+
+    text = text_columns()
+    workbook = load_workbook(file_location, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        # Blank header cells have no matching flight_data column
+        columns = [(i, clean_column_name(name)) for i, name in enumerate(header) if name is not None]
+
+        batch = []
+        for values in rows:
+            if all(value is None for value in values):
+                continue  # Skip blank lines like pd.read_excel does
+
+            row = {}
+            for i, name in columns:
+                value = values[i] if i < len(values) else None
+                if isinstance(value, float) and value.is_integer():
+                    value = int(value)  # Whole numbers come back as int, as with pandas
+                if name in text and value is not None and not isinstance(value, str):
+                    value = str(value)  # A numeric cell in a text column, e.g. a code typed as 7
+                row[name] = value
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        workbook.close()
+
+
+def frame_to_records(df: "pd.DataFrame") -> List[Dict[str, Any]]:
+    df.columns = [clean_column_name(name) for name in df.columns]
+    df = df.astype(object).where(df.notna(), None)  # Replace NaN with None (NULL)
+    return df.to_dict(orient='records')
+
+
+def iter_csv_batches(file_location: str, chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield lists of CSV rows, typed to match what iter_excel_batches gives for the same sheet.
+
+    Text columns are read as str, so codes like 007 keep their zeros, and only
+    an empty field is NULL ("NA", "null" and the like are values). Whole numbers
+    in columns pandas reads as float (an int column with a blank) become int.
+    """
+    import pandas as pd
+
+    text = text_columns()
+    header = pd.read_csv(file_location, nrows=0).columns
+    dtype = {name: str for name in header if clean_column_name(name) in text}
+
+    # pandas' C parser reads the file a chunk at a time
+    for chunk in pd.read_csv(file_location, chunksize=chunk_size, dtype=dtype, keep_default_na=False, na_values=[""]):
+        for name in chunk.columns[chunk.dtypes == "float64"]:
+            values = [int(v) if v.is_integer() else v for v in chunk[name].tolist()]
+            chunk[name] = pd.Series(values, index=chunk.index, dtype=object)
+        yield frame_to_records(chunk)
+
+
+def iter_parquet_batches(file_location: str, chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    import pyarrow.parquet as pq
+
+    # Parquet is already columnar: decode record batches straight into frames
+    parquet_file = pq.ParquetFile(file_location)
+    for record_batch in parquet_file.iter_batches(batch_size=chunk_size):
+        yield frame_to_records(record_batch.to_pandas())
+
+
+BATCH_READERS = {
+    "excel": iter_excel_batches,
+    "csv": iter_csv_batches,
+    "parquet": iter_parquet_batches,
+}
+
+
+def insert_batches(db: Session, batches: Iterator[List[Dict[str, Any]]], file_reference: str, job=None) -> int:
+    # Only one batch of parsed rows is held in memory at a time
+    inserted = 0
+    for batch in batches:
+        # Each batch also renews the upload's content-hash claim; a claim taken
+        # over while this job stalled means another upload now owns the content
+        if not content_hashes.heartbeat(db, file_reference):
+            raise RuntimeError("the upload's content-hash claim was taken over by a newer upload")
+        metrics.UPLOAD_ROWS_PARSED.inc(len(batch))
+        if job is not None:
+            job.parsed(len(batch))
+        for row in batch:
+            row['File_Reference'] = file_reference  # Add file reference to every row
+        count = crud.insert_rows_into_test_table_v2(db, batch)
+        inserted += count
+        metrics.UPLOAD_ROWS_INSERTED.inc(count)
+        if job is not None:
+            job.inserted(count)
+    return inserted
+
+
+def new_file_reference() -> str:
+    # Upload time for readability, plus a random suffix so uploads in the same second differ
+    return f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:12]}"
+
+
+def save_upload(file: UploadFile) -> Tuple[str, str, str, str]:
+    """
+    Stream the upload to disk under a new file reference.
+
+    Returns (file_reference, file_location, ext, content_hash); the SHA-256 of
+    the content is computed from the same buffers as they are written.
+    """
     filename = file.filename  # original uploaded filename
     ext = os.path.splitext(filename)[1]  # gets the extension, like .xlsx
-    file_location = os.path.join(UPLOAD_FOLDER, f"{file_reference}{ext}")
-   
 
-    with open(file_location, "wb") as f:
-        f.write(file.file.read())
+    # Exclusive create: a reference whose file already exists is never reused
+    while True:
+        file_reference = new_file_reference()
+        file_location = os.path.join(UPLOAD_FOLDER, f"{file_reference}{ext}")
+        try:
+            f = open(file_location, "xb")
+            break
+        except FileExistsError:
+            continue
 
-    # Step 2: Process the Excel file
-    try:
-        # Read the Excel file into a DataFrame
-        df = pd.read_excel(file_location)
-        # Replace all spaces in column names with underscores
-        df.columns = df.columns.str.replace(r'[ \-\/\(\)=&]', '_', regex=True)
-
-        #os.system('cls')
-        #print("Uploaded file columns:", df.columns.tolist())
-        df = df.where(pd.notnull(df), None)  # Replace NaN with None (NULL)
-
-        # Assuming the Excel file contains columns 'Quarter' and 'Year' and renaming them
-        #df = df[['Quarter', 'Year','Marketing_Airline']]  # Select only required columns
-        df['File_Reference'] = file_reference  # Add file reference to DataFrame
-        
-    except Exception as e:
-        raise ValueError(f"Error processing the Excel file: {str(e)}")
+    hasher = content_hashes.new_hasher()
+    with f:
+        while True:
+            buffer = file.file.read(COPY_BUFFER_SIZE)
+            if not buffer:
+                break
+            hasher.update(buffer)
+            f.write(buffer)
+
+    return file_reference, file_location, ext, hasher.hexdigest()
+
+
+# Attempts at claiming a content hash while other uploads keep taking it over
+CLAIM_ATTEMPTS = 3
 
-    # Step 3: Insert rows into the 'test' table and file upload log
-    #db = database.SessionLocal()
 
-    # Convert DataFrame to list of dictionaries
-    data = df.to_dict(orient='records')  # Convert each row to a dictionary
+def claim_upload(db: Session, file_reference: str, file_location: str, content_hash: str, job_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Register the upload's content hash before it is parsed.
 
-    # Insert rows into the 'test' table (up to 10 rows depending on the flag)
-    crud.insert_rows_into_test_table_v2(db, data)
+    Returns None if this upload now owns the content, or the earlier claim as
+    {"file_reference", "job_id", "status"}; the duplicate copy on disk is then
+    removed. An abandoned claim (see content_hashes.is_abandoned) is taken
+    over, and the rows its job had already committed are deleted.
+    """
+    for _ in range(CLAIM_ATTEMPTS):
+        existing = content_hashes.claim(db, content_hash, file_reference, job_id)
+        if existing is None:
+            return None
+        if not content_hashes.is_abandoned(db, existing):
+            break
+        if content_hashes.take_over(db, content_hash, existing.file_reference, file_reference, job_id):
+            logger.warning("Taking over abandoned upload %s of the same content", existing.file_reference)
+            discard_rows(db, existing.file_reference)
+            return None
+    os.remove(file_location)
+    return {"file_reference": existing.file_reference, "job_id": existing.job_id, "status": existing.status}
 
-   
+
+def discard_rows(db: Session, file_reference: str):
+    # Chunks are committed as they are inserted, so a failed ingest leaves a partial file behind
+    deleted = crud.delete_file_rows(db, file_reference)
+    aggregates.aggregate_cache.invalidate(file_reference)
+    if deleted:
+        logger.info("Deleted %d rows of incomplete upload %s", deleted, file_reference)
+
+
+def ingest_upload(db: Session, file_reference: str, file_location: str, ext: str, job=None) -> int:
+    """
+    Parse a saved upload, insert its rows and log it.
+
+    `job` is an optional jobs.UploadJob that receives parsed/inserted row counts.
+    """
+    # Parse the file with the reader for its format and insert it in fixed-size batches
+    file_format = detect_file_format(file_location, ext)
+    try:
+        with metrics.UPLOAD_SECONDS.time():
+            batches = BATCH_READERS[file_format](file_location, crud.INSERT_CHUNK_SIZE)
+            inserted = insert_batches(db, batches, file_reference, job)
+    except Exception as e:
+        metrics.UPLOADS.labels("failed").inc()
+        db.rollback()
+        try:
+            discard_rows(db, file_reference)
+            content_hashes.release(db, file_reference)
+        except Exception:
+            # The claim then goes stale and the next upload of this content cleans up
+            logger.exception("Could not clean up failed upload %s", file_reference)
+            db.rollback()
+        raise ValueError(f"Error processing the {file_format} file: {str(e)}")
+    metrics.UPLOADS.labels("completed").inc()
+    aggregates.aggregate_cache.invalidate(file_reference)
 
     # Insert file upload log
     upload_timestamp = datetime.now()
@@ -59,5 +297,24 @@ def process_file_upload(file: UploadFile,db):
         'Upload_Timestamp': upload_timestamp
     }
     crud.insert_upload_log(db, log_data)
+    content_hashes.complete(db, file_reference)
+
+    # Columnar copy for rule runs and reads; the database stays the source of truth
+    try:
+        snapshots.build_snapshot(db, file_reference)
+    except Exception:
+        logger.exception("Could not build the snapshot for %s", file_reference)
+        snapshots.remove_snapshot(file_reference)
 
+    return inserted
+
+
+def process_file_upload(file: UploadFile,db):
+    # Synchronous upload: save the file, then parse and insert it in this thread
+    file_reference, file_location, ext, content_hash = save_upload(file)
+    check_upload_format(file_location, ext)
+    existing = claim_upload(db, file_reference, file_location, content_hash)
+    if existing is not None:
+        return existing["file_reference"]
+    ingest_upload(db, file_reference, file_location, ext)
     return file_reference
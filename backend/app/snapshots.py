@@ -0,0 +1,378 @@
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, Numeric, String, Table, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import database
+from .schema_registry import get_registry
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, write-backs are only serialised by the database
+    fcntl = None
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Arrow IPC copies of each file's flight_data rows, one per File_Reference
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+SNAPSHOTS_ENABLED = os.getenv("SNAPSHOTS_ENABLED", "true").lower() == "true"
+
+# Rows read from the database per record batch while building a snapshot
+SNAPSHOT_BATCH_SIZE = 10000
+
+# Arrow schema metadata key holding the file's data version the snapshot was built at
+VERSION_KEY = b"data_version"
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------
+# Data versions
+# ---------------------------------------
+
+snapshot_metadata = MetaData()
+
+# Bumped in the same transaction as every write-back to a file's flight_data rows.
+# A snapshot is only used while the version it was built at is still current, so
+# a write from another process or host (or a crash mid-write) can't leave it in use.
+file_data_versions = Table(
+    "file_data_versions",
+    snapshot_metadata,
+    Column("file_reference", String(255), primary_key=True),
+    Column("version", Integer, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+
+def current_version(db: Optional[Session], file_reference: str) -> int:
+    query = select(file_data_versions.c.version).where(file_data_versions.c.file_reference == file_reference)
+    if db is None:
+        with database.engine.connect() as conn:
+            return conn.execute(query).scalar() or 0
+    return db.execute(query).scalar() or 0
+
+
+def bump_version(db: Session, file_reference: str) -> int:
+    """
+    Increment the file's data version in the caller's transaction and return it.
+
+    The UPDATE also row-locks the version until the caller commits, which
+    serialises writers to the same file across processes and hosts.
+    """
+    table = file_data_versions
+    scope = table.c.file_reference == file_reference
+    now = datetime.now()
+    bump = update(table).where(scope).values(version=table.c.version + 1, updated_at=now)
+    if not db.execute(bump).rowcount:
+        try:
+            db.execute(insert(table).values(file_reference=file_reference, version=1, updated_at=now))
+        except IntegrityError:
+            db.execute(bump)  # First write to the file raced with another one
+    return db.execute(select(table.c.version).where(scope)).scalar_one()
+
+
+# ---------------------------------------
+# Paths and locking
+# ---------------------------------------
+
+def snapshot_path(file_reference: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"{file_reference}.arrow")
+
+
+def has_snapshot(file_reference: str) -> bool:
+    return SNAPSHOTS_ENABLED and os.path.exists(snapshot_path(file_reference))
+
+
+@contextmanager
+def file_lock(file_reference: str, blocking: bool = True):
+    """
+    Exclusive flock on the snapshot's .lock file, shared by every thread and process on the host.
+
+    Yields False instead of waiting when `blocking` is off and another holder
+    has it. The kernel drops the lock if its holder dies, so a crash never
+    leaves a file locked.
+    """
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with open(snapshot_path(file_reference) + ".lock", "a") as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _remove_files(file_reference: str):
+    path = snapshot_path(file_reference)
+    for leftover in (path, f"{path}.stale", f"{path}.tmp"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+
+
+def remove_snapshot(file_reference: str):
+    with file_lock(file_reference):
+        _remove_files(file_reference)
+
+
+def recover_snapshots() -> List[str]:
+    """
+    Delete what crashed write-backs and builds left behind (.stale, .tmp) and
+    return the affected file references.
+
+    Files still locked belong to a write in progress and are left alone. The
+    snapshot itself is rebuilt the next time a rule runs on the file.
+    """
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    recovered = []
+    for name in os.listdir(SNAPSHOT_DIR):
+        for suffix in (".arrow.stale", ".arrow.tmp"):
+            if name.endswith(suffix):
+                file_reference = name[:-len(suffix)]
+                with file_lock(file_reference, blocking=False) as locked:
+                    if locked:
+                        _remove_files(file_reference)
+                        recovered.append(file_reference)
+    return recovered
+
+
+# ---------------------------------------
+# Building from flight_data
+# ---------------------------------------
+
+def arrow_type(column):
+    import pyarrow as pa
+
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Numeric) and column.type.asdecimal and column.type.precision:
+        return pa.decimal128(column.type.precision, column.type.scale or 0)
+    if isinstance(column.type, Numeric):
+        return pa.float64()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    return pa.string()
+
+
+def arrow_schema(table: Table):
+    import pyarrow as pa
+
+    return pa.schema([pa.field(column.name, arrow_type(column)) for column in table.columns])
+
+
+def _write_batches(path: str, schema, batches):
+    import pyarrow as pa
+
+    # Write next to the target and rename, so readers never see a half-written file
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+    os.replace(tmp_path, path)
+
+
+def _db_batches(db: Session, table: Table, file_reference: str, schema):
+    import pyarrow as pa
+
+    query = select(table).where(table.c.File_Reference == file_reference).order_by(table.c.id)
+    result = db.execute(query.execution_options(stream_results=True, yield_per=SNAPSHOT_BATCH_SIZE))
+    for rows in result.partitions():
+        columns = list(zip(*rows))
+        yield pa.record_batch(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+        )
+
+
+def build_snapshot(db: Session, file_reference: str) -> Optional[str]:
+    """
+    Write every flight_data row of a file, ordered by id, to its Arrow snapshot.
+
+    Returns the snapshot path, or None when snapshots are disabled.
+    """
+    if not SNAPSHOTS_ENABLED:
+        return None
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    table = get_registry(database.engine).get_table("flight_data")
+    path = snapshot_path(file_reference)
+    with file_lock(file_reference):
+        # Version before rows: a write committing meanwhile makes the snapshot look older, never newer
+        version = current_version(db, file_reference)
+        schema = arrow_schema(table).with_metadata({VERSION_KEY: str(version).encode()})
+        _write_batches(path, schema, _db_batches(db, table, file_reference, schema))
+        if os.path.exists(f"{path}.stale"):
+            os.remove(f"{path}.stale")
+    return path
+
+
+# ---------------------------------------
+# Reading
+# ---------------------------------------
+
+def snapshot_version(snapshot) -> Optional[int]:
+    version = (snapshot.schema.metadata or {}).get(VERSION_KEY)
+    return int(version) if version is not None else None
+
+
+@contextmanager
+def _open(file_reference: str, db: Optional[Session] = None):
+    """
+    Memory-map a file's snapshot and yield it as a pyarrow Table, or None.
+
+    None also when the snapshot was built at another data version than the
+    database's, i.e. the rows changed since. Columns are not copied until they
+    are converted, so reading a few columns of a wide file only touches those
+    columns' pages.
+    """
+    if not has_snapshot(file_reference):
+        yield None
+        return
+    import pyarrow as pa
+
+    try:
+        source = pa.memory_map(snapshot_path(file_reference))
+    except FileNotFoundError:
+        yield None  # Moved aside by a write-back
+        return
+    with source:
+        snapshot = pa.ipc.open_file(source).read_all()
+        if snapshot_version(snapshot) != current_version(db, file_reference):
+            yield None
+            return
+        yield snapshot
+
+
+def _select(snapshot, columns: Optional[List[str]]):
+    if columns is None:
+        return snapshot
+    names = ["id"] + [col for col in columns if col != "id"]
+    if any(name not in snapshot.column_names for name in names):
+        return None  # Snapshot predates a schema change: read from the database
+    return snapshot.select(names)
+
+
+def load_frame(file_reference: str, columns: List[str], db: Optional[Session] = None) -> Optional["pd.DataFrame"]:
+    """
+    id + `columns` of a file as an object DataFrame holding the same Python
+    values a database read returns (int, Decimal, str, None).
+
+    Returns None when the file has no usable snapshot.
+    """
+    with _open(file_reference, db) as snapshot:
+        if snapshot is None:
+            return None
+        selected = _select(snapshot, columns)
+        if selected is None:
+            return None
+        frame = selected.to_pandas(integer_object_nulls=True, timestamp_as_object=True)
+    return frame.astype(object).where(frame.notna(), None)
+
+
+def read_rows(file_reference: str, columns: Optional[List[str]] = None, after_id: Optional[int] = None,
+              limit: Optional[int] = None) -> Optional[Tuple[List[str], list]]:
+    """
+    Keyset page of a file's rows as (keys, rows), like crud.get_file_record_rows.
+
+    Returns None when the file has no usable snapshot.
+    """
+    with _open(file_reference) as snapshot:
+        if snapshot is None:
+            return None
+        selected = _select(snapshot, columns)
+        if selected is None:
+            return None
+        start = 0
+        if after_id is not None:
+            import numpy as np
+
+            ids = selected.column("id").to_numpy()
+            start = int(np.searchsorted(ids, after_id, side="right"))
+        page = selected.slice(start, limit)
+        values = [page.column(i).to_pylist() for i in range(page.num_columns)]
+        return page.column_names, list(zip(*values))
+
+
+# ---------------------------------------
+# Keeping snapshots in step with write-backs
+# ---------------------------------------
+
+@contextmanager
+def write_back(db: Session, file_reference: str, columns: List[str]):
+    """
+    Wrap a write to `columns` of one file's flight_data rows; the block commits.
+
+    The file lock serialises write-backs to the file across threads and
+    processes on the host, and the file's data version is bumped in the
+    block's transaction. The snapshot is moved aside for the duration, so
+    readers fall back to the database. Once the block has committed, the
+    written columns are re-read (id and those columns only) and swapped in,
+    provided no other write reached the file in between. Otherwise, or if
+    the block raises, the snapshot is dropped and rebuilt on the next rule run.
+    """
+    if not SNAPSHOTS_ENABLED:
+        bump_version(db, file_reference)
+        yield
+        return
+
+    path = snapshot_path(file_reference)
+    stale_path = f"{path}.stale"
+    with file_lock(file_reference):
+        version = bump_version(db, file_reference)
+        active = os.path.exists(path)
+        if active:
+            os.replace(path, stale_path)
+
+        try:
+            yield
+        except BaseException:
+            _remove_files(file_reference)
+            raise
+
+        if not active:
+            _remove_files(file_reference)  # Leftovers of a crashed write
+            return
+        try:
+            _refresh_columns(db, file_reference, stale_path, path, columns, version)
+        except Exception:
+            logger.exception("Dropping snapshot for %s after a failed refresh", file_reference)
+            _remove_files(file_reference)
+
+
+def _refresh_columns(db: Session, file_reference: str, stale_path: str, path: str, columns: List[str], version: int):
+    import pyarrow as pa
+
+    # Version before rows, as in build_snapshot
+    if current_version(db, file_reference) != version:
+        raise ValueError("Another write reached the file after this one")
+    table = get_registry(database.engine).get_table("flight_data")
+    query = (
+        select(table.c.id, *(table.c[col] for col in columns))
+        .where(table.c.File_Reference == file_reference)
+        .order_by(table.c.id)
+    )
+    rows = db.execute(query).fetchall()
+
+    with pa.memory_map(stale_path) as source:
+        snapshot = pa.ipc.open_file(source).read_all()
+        if snapshot_version(snapshot) != version - 1:
+            raise ValueError("Snapshot was already out of date before this write")
+        if snapshot.column("id").to_pylist() != [row[0] for row in rows]:
+            raise ValueError("Rows changed since the snapshot was built")
+        for i, col in enumerate(columns, start=1):
+            position = snapshot.schema.get_field_index(col)
+            field = snapshot.schema.field(position)
+            snapshot = snapshot.set_column(position, field, pa.array([row[i] for row in rows], type=field.type))
+        snapshot = snapshot.replace_schema_metadata({VERSION_KEY: str(version).encode()})
+        _write_batches(path, snapshot.schema, snapshot.to_batches())
+    os.remove(stale_path)
@@ -0,0 +1,155 @@
+"""
+Throughput of the async read endpoints under concurrent clients.
+
+    cd backend && python -m benchmarks.bench_concurrency --rows 2000 --requests 200 --latency-ms 5
+
+Requests go through httpx's ASGI transport against a SQLite file (aiosqlite
+for the async session), at 1, 4 and 16 concurrent clients. Local SQLite
+answers in microseconds, so every statement is given `--latency-ms` of
+simulated round-trip time, as a network hop to MySQL would add:
+
+    latency_in_driver       the wait happens in aiosqlite's connection thread,
+                            like a real driver awaiting the server; the event
+                            loop serves other requests meanwhile
+    latency_on_event_loop   baseline: the same wait blocks the event loop, as
+                            a synchronous Session in an async handler would
+
+Exits non-zero unless latency_in_driver at the highest concurrency reaches
+MIN_SCALING times its single-client throughput.
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import sys
+import time
+
+from .common import create_schema, seed_file, use_sqlite_database
+
+FILE_REFERENCE = "20250101000000"
+CONCURRENCY_LEVELS = (1, 4, 16)
+
+# Required speed-up of the highest concurrency level over one client
+MIN_SCALING = 2.0
+
+
+async def run_level(client, paths, total: int, concurrency: int) -> dict:
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(paths[i % len(paths)])
+
+    async def worker():
+        while not queue.empty():
+            path = queue.get_nowait()
+            response = await client.get(path)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"concurrency": concurrency, "seconds": round(elapsed, 4), "requests_per_second": round(total / elapsed, 1)}
+
+
+async def run(total: int) -> list:
+    import httpx
+    from app.main import app
+
+    # Projected pages, as the frontend asks for: decoding all 120+ columns is CPU work that
+    # no amount of concurrency spreads across one interpreter
+    paths = ["/files/", f"/files/{FILE_REFERENCE}?limit=100&columns=Seats,Total_Passengers", "/rules"]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await run_level(client, paths, len(paths), 1)  # Warm up the schema registry and pool
+        return [await run_level(client, paths, total, level) for level in CONCURRENCY_LEVELS]
+
+
+# ---------------------------------------
+# Simulated database round trips
+# ---------------------------------------
+
+def latency_in_driver(async_engine, seconds: float):
+    """
+    Delay every statement inside aiosqlite's worker thread; returns an undo function.
+    """
+    from sqlalchemy import event
+
+    class SlowCursor(sqlite3.Cursor):
+        def execute(self, *args):
+            time.sleep(seconds)
+            return super().execute(*args)
+
+        def executemany(self, *args):
+            time.sleep(seconds)
+            return super().executemany(*args)
+
+    class SlowConnection(sqlite3.Connection):
+        def cursor(self, factory=SlowCursor):
+            return super().cursor(factory)
+
+    def connect(dialect, connection_record, cargs, cparams):
+        cparams["factory"] = SlowConnection  # aiosqlite passes it on to sqlite3.connect
+
+    event.listen(async_engine.sync_engine, "do_connect", connect)
+    return lambda: event.remove(async_engine.sync_engine, "do_connect", connect)
+
+
+def latency_on_event_loop(async_engine, seconds: float):
+    """
+    Delay every statement in the thread running the event loop; returns an undo function.
+    """
+    from sqlalchemy import event
+
+    def block(conn, cursor, statement, parameters, context, executemany):
+        time.sleep(seconds)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", block)
+    return lambda: event.remove(async_engine.sync_engine, "before_cursor_execute", block)
+
+
+def run_with(add_latency, seconds: float, total: int) -> list:
+    from app import database
+
+    undo = add_latency(database.async_engine, seconds)
+    try:
+        # Fresh connections, so the driver-level latency applies to every one of them
+        asyncio.run(database.async_engine.dispose())
+        return asyncio.run(run(total))
+    finally:
+        undo()
+        asyncio.run(database.async_engine.dispose())
+
+
+def scaling(levels: list) -> float:
+    return round(levels[-1]["requests_per_second"] / levels[0]["requests_per_second"], 2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    use_sqlite_database()
+    from app import database
+    create_schema(database.engine)
+    seed_file(database.engine, FILE_REFERENCE, args.rows)
+
+    seconds = args.latency_ms / 1000
+    in_driver = run_with(latency_in_driver, seconds, args.requests)
+    on_event_loop = run_with(latency_on_event_loop, seconds, args.requests)
+    results = {
+        "rows": args.rows,
+        "requests": args.requests,
+        "latency_ms": args.latency_ms,
+        "latency_in_driver": {"levels": in_driver, "scaling": scaling(in_driver)},
+        "latency_on_event_loop": {"levels": on_event_loop, "scaling": scaling(on_event_loop)},
+        "min_scaling": MIN_SCALING,
+    }
+    print(json.dumps(results, indent=2))
+    if scaling(in_driver) < MIN_SCALING:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Compare the two GET /files/{file_id} serialization paths.
+
+    cd backend && python -m benchmarks.bench_serialization --rows 20000
+
+"pydantic" is the previous path: ORM objects -> dynamic Pydantic model ->
+.dict() -> jsonable_encoder -> JSON. "direct" is the Core rows -> JSON path
+the endpoints use now.
+"""
+import argparse
+import json
+
+from .common import create_schema, seed_file, timeit, use_sqlite_database
+
+FILE_REFERENCE = "20250101000000"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    use_sqlite_database()
+    from app import database
+    create_schema(database.engine)
+    seed_file(database.engine, FILE_REFERENCE, args.rows)
+
+    from fastapi.encoders import jsonable_encoder
+    from app import crud, serializers
+    from app.schemas import table_to_pydantic
+
+    db = database.SessionLocal()
+
+    def pydantic_path():
+        records = crud.get_test_records_by_file_reference(db, FILE_REFERENCE)
+        FlightDataSchema = table_to_pydantic("flight_data", database.engine)
+        record_data = [FlightDataSchema.model_validate(record).model_dump() for record in records]
+        return json.dumps(jsonable_encoder(record_data))
+
+    def direct_path():
+        keys, rows = crud.get_file_record_rows(db, FILE_REFERENCE)
+        return serializers.dumps(serializers.rows_to_dicts(keys, rows))
+
+    assert json.loads(pydantic_path()) == json.loads(direct_path())
+
+    results = {"rows": args.rows, "pydantic": timeit(pydantic_path, args.repeat), "direct": timeit(direct_path, args.repeat)}
+    results["speedup"] = round(results["pydantic"]["best_seconds"] / results["direct"]["best_seconds"], 2)
+    print(json.dumps(results, indent=2))
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
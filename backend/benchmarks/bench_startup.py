@@ -0,0 +1,83 @@
+"""
+Cold start of the API: what a worker pays before it can serve, on each (re)start.
+
+    cd backend && python -m benchmarks.bench_startup --repeat 5
+
+Every measurement runs in a fresh interpreter, so nothing is already imported:
+
+    import_app      `import app.main`, which must not touch the database
+    startup         import plus the lifespan (migrations, flight_data reflection)
+    first_request   startup plus GET /files/
+
+Also lists the heavy libraries already loaded once `app.main` is imported;
+they should load on first use, so the list is expected to be empty.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from .common import create_schema, seed_file, timeit, use_sqlite_database
+
+FILE_REFERENCE = "20250101000000"
+
+# Expected to load on first use, not when app.main is imported
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl", "pyarrow", "inflect")
+
+IMPORT_APP = "import app.main"
+STARTUP = """
+from fastapi.testclient import TestClient
+import app.main
+with TestClient(app.main.app):
+    pass
+"""
+FIRST_REQUEST = """
+from fastapi.testclient import TestClient
+import app.main
+with TestClient(app.main.app) as client:
+    client.get("/files/").raise_for_status()
+"""
+LOADED_MODULES = f"""
+import json, sys
+import app.main
+print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))
+"""
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(code: str, workdir: str) -> str:
+    # Run from the throwaway directory so the uploads/ and snapshots/ the app creates land there
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR)
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=workdir, env=env, capture_output=True, text=True, check=True,
+    )
+    return result.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="flight-bench-")
+    use_sqlite_database(os.path.join(workdir, "flight.db"))
+    from app import database
+    create_schema(database.engine)
+    seed_file(database.engine, FILE_REFERENCE, 100)
+    database.engine.dispose()
+
+    results = {
+        "repeat": args.repeat,
+        "import_app": timeit(lambda: run_python(IMPORT_APP, workdir), args.repeat),
+        "startup": timeit(lambda: run_python(STARTUP, workdir), args.repeat),
+        "first_request": timeit(lambda: run_python(FIRST_REQUEST, workdir), args.repeat),
+        "heavy_modules_loaded_at_import": json.loads(run_python(LOADED_MODULES, workdir)),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Show that the hot File_Reference lookups stop scanning flight_data and
+file_upload_log once the migrations have run.
+
+    cd backend && python -m benchmarks.check_query_plans          # SQLite copy of flight.sql
+    cd backend && DATABASE_URL=mysql+pymysql://... python -m benchmarks.check_query_plans --live
+
+Exits non-zero if any lookup still scans a whole table after migrating.
+"""
+import argparse
+import json
+import sys
+
+from .common import create_schema, seed_file, use_sqlite_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--live", action="store_true", help="use DATABASE_URL as-is instead of a SQLite copy")
+    args = parser.parse_args()
+
+    if not args.live:
+        use_sqlite_database()
+    from app import database, migrations
+
+    if not args.live:
+        create_schema(database.engine)
+        seed_file(database.engine, "20250101000000", 1000)
+        before = migrations.check_query_plans(database.engine)
+    else:
+        before = None
+
+    applied = migrations.apply_migrations(database.engine)
+    after = migrations.check_query_plans(database.engine)
+
+    print(json.dumps({"applied": applied, "before": before, "after": after}, indent=2, default=str))
+    if not all(check["uses_index"] for check in after.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Check that column-wise rule evaluation returns exactly what the per-row eval loop returns.
+
+    cd backend && python -m benchmarks.check_rule_engine
+
+Covers int64 overflow (large products and powers), mixed int/float object
+columns, NULLs, Decimals and division by zero. Values and their Python types
+must match row for row. Exits non-zero on any mismatch.
+"""
+import json
+import sys
+from decimal import Decimal
+
+EQUATIONS = [
+    "Seats * 10**18",
+    "Seats ** 70",
+    "Seats ** Departures",
+    "(Seats * 10**18) / 10**18",
+    "(Seats * 10**18) % 7",
+    "Seats * 10**18 > 5",
+    "Seats * Seats * Seats * Seats * Seats",
+    "-Seats * 9223372036854775807",
+    "Seats // Departures",
+    "Seats / Departures",
+    "Seats * Load_Factor",
+    "Seats + Load_Factor * 2",
+    "Fuel_Expense * Seats",
+    "Seats * 2 + Departures - 100",
+    "100",
+]
+
+
+def make_frame():
+    import pandas as pd
+
+    return pd.DataFrame({
+        "Seats": [3, 30, 5, 2 ** 40, None, -7, 0],
+        "Departures": [1, 2, 0, 63, 4, None, 3],
+        "Load_Factor": [3, 2.5, 4, 0.5, 1, 2, None],  # ints and floats in one column
+        "Fuel_Expense": [Decimal("1.50"), Decimal("2"), None, Decimal("0.25"), Decimal("3"), Decimal("4"), Decimal("5")],
+    }, dtype=object)
+
+
+def row_results(compiled, frame):
+    results = {}
+    for idx, row in zip(frame.index, frame.to_dict("records")):
+        try:
+            results[idx] = compiled.evaluate_row(row)
+        except Exception:
+            pass  # The row loop skips rows that raise
+    return results
+
+
+def main():
+    from app.rule_engine import compile_rule
+
+    frame = make_frame()
+    mismatches = []
+    for equation in EQUATIONS:
+        compiled = compile_rule(equation)
+        column_wise = compiled.evaluate(frame).to_dict()
+        expected = row_results(compiled, frame)
+        same = column_wise.keys() == expected.keys() and all(
+            type(column_wise[idx]) is type(expected[idx]) and column_wise[idx] == expected[idx] for idx in expected
+        )
+        if not same:
+            mismatches.append({"equation": equation, "column_wise": repr(column_wise), "row_loop": repr(expected)})
+
+    print(json.dumps({"equations": len(EQUATIONS), "mismatches": mismatches}, indent=2))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
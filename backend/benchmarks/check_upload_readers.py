@@ -0,0 +1,101 @@
+"""
+Check that the same sheet uploaded as .xlsx and as .csv is parsed into the same rows.
+
+    cd backend && python -m benchmarks.check_upload_readers --rows 500
+
+Synthetic rows plus the cases where pandas' CSV defaults used to differ from
+the workbook reader: text codes with leading zeros (FAC 007), text
+values pandas reads as NULL (Marketing_Airline NA) and int columns with a
+blank cell. Exits non-zero on any mismatch.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+from decimal import Decimal
+
+from .common import create_schema, use_sqlite_database
+from .synthetic import _headers, flight_columns, iter_flight_rows
+
+# Appended to the synthetic rows; both readers must return these values exactly
+EDGE_CASES = [
+    {"FAC": "007", "Marketing_Airline": "NA", "Seats": None},
+    {"FAC": "0", "Marketing_Airline": "null", "Seats": 10},
+    {"FAC": "1e3", "Marketing_Airline": "N/A", "Departures": None},
+]
+
+
+def sheet_rows(count: int) -> list:
+    rows = [[None if v == "" else v for v in row.values()] for row in iter_flight_rows(count)]
+    names = [col for col, *_ in flight_columns()]
+    for case in EDGE_CASES:
+        template = dict(zip(names, rows[0]))
+        if not case.keys() <= template.keys():
+            raise ValueError(f"Not flight_data columns: {sorted(case.keys() - template.keys())}")
+        template.update(case)
+        rows.append(list(template.values()))
+    return rows
+
+
+def write_both(rows: list, workdir: str):
+    from openpyxl import Workbook
+
+    headers = _headers(flight_columns())
+    xlsx_path = os.path.join(workdir, "sheet.xlsx")
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("flight_data")
+    sheet.append(headers)
+    for row in rows:
+        sheet.append([float(v) if isinstance(v, Decimal) else v for v in row])
+    workbook.save(xlsx_path)
+
+    csv_path = os.path.join(workdir, "sheet.csv")
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        writer.writerows(["" if v is None else v for v in row] for row in rows)
+    return xlsx_path, csv_path
+
+
+def read_all(reader, path: str) -> list:
+    return [row for batch in reader(path, 100) for row in batch]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="flight-check-")
+    use_sqlite_database(os.path.join(workdir, "flight.db"))
+    from app import database, services
+    create_schema(database.engine)
+
+    xlsx_path, csv_path = write_both(sheet_rows(args.rows), workdir)
+    from_xlsx = read_all(services.iter_excel_batches, xlsx_path)
+    from_csv = read_all(services.iter_csv_batches, csv_path)
+
+    mismatches = []
+    if len(from_xlsx) != len(from_csv):
+        mismatches.append({"rows": {"xlsx": len(from_xlsx), "csv": len(from_csv)}})
+    for i, (x, c) in enumerate(zip(from_xlsx, from_csv)):
+        diff = {key: {"xlsx": repr(x.get(key)), "csv": repr(c.get(key))}
+                for key in x.keys() | c.keys()
+                if type(x.get(key)) is not type(c.get(key)) or x.get(key) != c.get(key)}
+        if diff:
+            mismatches.append({"row": i, "columns": diff})
+    for i, expected in enumerate(EDGE_CASES, start=len(from_xlsx) - len(EDGE_CASES)):
+        for reader, rows in (("xlsx", from_xlsx), ("csv", from_csv)):
+            got = {key: rows[i].get(key) for key in expected}
+            if got != expected:
+                mismatches.append({"row": i, "reader": reader, "expected": repr(expected), "got": repr(got)})
+
+    print(json.dumps({"rows": len(from_xlsx), "mismatches": mismatches[:20]}, indent=2))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
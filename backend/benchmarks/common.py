@@ -0,0 +1,114 @@
+import os
+import random
+import re
+import tempfile
+import time
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+# flight.sql at the repository root is the source of truth for the table layout
+FLIGHT_SQL = Path(__file__).resolve().parents[2] / "flight.sql"
+
+CREATE_TABLE_PATTERN = re.compile(r"CREATE TABLE IF NOT EXISTS `(\w+)` \((.*?)\n\)", re.S)
+COLUMN_PATTERN = re.compile(r"`(\w+)` (\w+)(?:\((\d+)(?:,(\d+))?\))?")
+
+
+def use_sqlite_database(path: str = None) -> str:
+    """
+    Point the app at a throwaway SQLite file. Must run before importing `app`.
+    """
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="flight-bench-"), "flight.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    return os.environ["DATABASE_URL"]
+
+
+def parse_flight_sql() -> Dict[str, List[tuple]]:
+    # {table: [(column, mysql_type, precision, scale), ...]}
+    tables = {}
+    for name, body in CREATE_TABLE_PATTERN.findall(FLIGHT_SQL.read_text()):
+        columns = []
+        for line in body.strip().splitlines():
+            match = COLUMN_PATTERN.match(line.strip())
+            if match:
+                col, col_type, precision, scale = match.groups()
+                columns.append((col, col_type.lower(), precision, scale))
+        tables[name] = columns
+    return tables
+
+
+def sqlite_type(col_type: str, precision, scale) -> str:
+    if col_type in ("int", "bigint"):
+        return "BIGINT" if col_type == "bigint" else "INTEGER"
+    if col_type == "decimal":
+        return f"DECIMAL({precision},{scale})"
+    if col_type == "datetime":
+        return "DATETIME"
+    if col_type == "varchar":
+        return f"VARCHAR({precision})"
+    return "TEXT"
+
+
+def create_schema(engine):
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        for table, columns in parse_flight_sql().items():
+            ddl = []
+            for col, col_type, precision, scale in columns:
+                if col == "id":
+                    ddl.append('"id" INTEGER PRIMARY KEY AUTOINCREMENT')
+                else:
+                    ddl.append(f'"{col}" {sqlite_type(col_type, precision, scale)}')
+            conn.execute(text(f'DROP TABLE IF EXISTS "{table}"'))
+            conn.execute(text(f'CREATE TABLE "{table}" ({", ".join(ddl)})'))
+
+
+def make_rows(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    # Random values shaped by each flight_data column's declared type
+    rng = random.Random(seed)
+    columns = [c for c in parse_flight_sql()["flight_data"] if c[0] not in ("id", "File_Reference")]
+    rows = []
+    for _ in range(count):
+        row = {}
+        for col, col_type, precision, scale in columns:
+            if rng.random() < 0.05:
+                row[col] = None
+            elif col_type in ("int", "bigint"):
+                row[col] = rng.randint(0, 100000)
+            elif col_type == "decimal":
+                row[col] = Decimal(rng.randint(0, 10 ** (int(precision) - int(scale) - 1) * 10 ** int(scale))).scaleb(-int(scale))
+            else:
+                row[col] = f"{col[:6]}_{rng.randint(0, 50)}"
+        rows.append(row)
+    return rows
+
+
+def seed_file(engine, file_reference: str, count: int, seed: int = 0):
+    from sqlalchemy import text
+
+    rows = make_rows(count, seed)
+    for row in rows:
+        row["File_Reference"] = file_reference
+    columns = list(rows[0].keys())
+    with engine.begin() as conn:
+        conn.execute(
+            text(f'INSERT INTO flight_data ({", ".join(f"`{c}`" for c in columns)}) '
+                 f'VALUES ({", ".join(f":{c}" for c in columns)})'),
+            [{c: (str(v) if isinstance(v, Decimal) else v) for c, v in row.items()} for row in rows],
+        )
+        conn.execute(
+            text("INSERT INTO file_upload_log (File_Reference, File_Name, Upload_Timestamp) "
+                 "VALUES (:ref, :name, '2025-01-01 00:00:00')"),
+            {"ref": file_reference, "name": f"{file_reference}.xlsx"},
+        )
+
+
+def timeit(func: Callable[[], Any], repeat: int = 5) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return {"best_seconds": round(min(timings), 6), "mean_seconds": round(sum(timings) / len(timings), 6)}
@@ -0,0 +1,129 @@
+"""
+End-to-end benchmark suite over the HTTP API, on a throwaway SQLite file.
+
+    cd backend && python -m benchmarks.run_suite --sizes 1000,10000 --output results.json
+
+For each size a synthetic workbook is generated (benchmarks.synthetic) and
+pushed through the API:
+
+    upload            POST /upload/ until its job completes
+    read_file         GET /files/{file_id}
+    read_file_page    GET /files/{file_id}?limit=1000
+    get_columns       GET /get-columns/flight_data
+    execute_rule_sql  POST /execute-rule, pushed down to one UPDATE
+    execute_rule_py   POST /execute-rule with mode=python
+
+Every timing is the best and mean of --repeat runs (uploads run once per
+size). Results are JSON so two runs can be diffed or compared by a script.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from .common import create_schema, timeit, use_sqlite_database
+from .synthetic import write_workbook
+
+RULE = {
+    "rule_name": "bench_fuel",
+    "rule_description": "benchmark rule",
+    "target_column": "Fuel_Expense",
+    "conditions": "",
+    "equation": "Total_Passengers * 2 + Seats - 100",
+    "selcols": "|Total_Passengers||Seats|",
+}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def upload(client, path: str) -> dict:
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        response = client.post("/upload/", files={"file": (os.path.basename(path), f)})
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    while True:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("completed", "failed"):
+            break
+        time.sleep(0.05)
+    if job["status"] == "failed":
+        raise RuntimeError(f"Upload failed: {job['error']}")
+    elapsed = time.perf_counter() - started
+    return {"seconds": round(elapsed, 4), "rows": job["rows_inserted"],
+            "rows_per_second": round(job["rows_inserted"] / elapsed), "file_reference": job["file_reference"]}
+
+
+def run_size(client, workdir: str, size: int, repeat: int, rule_id: int) -> dict:
+    path = write_workbook(os.path.join(workdir, f"flights_{size}.xlsx"), size, seed=size)
+    results = {"rows": size, "workbook_bytes": os.path.getsize(path)}
+
+    results["upload"] = upload(client, path)
+    file_reference = results["upload"].pop("file_reference")
+    log_id = next(f["id"] for f in client.get("/files/").json() if f["file_reference"] == file_reference)
+
+    def get(url):
+        return lambda: client.get(url).raise_for_status()
+
+    def execute(mode):
+        return lambda: client.post("/execute-rule", json={"rule_id": rule_id, "file_id": log_id, "mode": mode}).raise_for_status()
+
+    results["read_file"] = timeit(get(f"/files/{file_reference}"), repeat)
+    results["read_file_page"] = timeit(get(f"/files/{file_reference}?limit=1000"), repeat)
+    results["get_columns"] = timeit(get("/get-columns/flight_data"), repeat)
+    results["execute_rule_sql"] = timeit(execute("sql"), repeat)
+    results["execute_rule_py"] = timeit(execute("python"), repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated row counts, e.g. 1000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    workdir = tempfile.mkdtemp(prefix="flight-suite-")
+    use_sqlite_database(os.path.join(workdir, "flight.db"))
+    from app import database
+    create_schema(database.engine)
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    report = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "database": "sqlite",
+        "repeat": args.repeat,
+        "results": [],
+    }
+    with TestClient(app) as client:  # runs the lifespan, so migrations are applied
+        rule_id = client.post("/save-rule/", json=RULE).raise_for_status().json()["id"]
+        for size in sizes:
+            report["results"].append(run_size(client, workdir, size, args.repeat, rule_id))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Synthetic flight_data generator for benchmarks.
+
+    cd backend && python -m benchmarks.synthetic --rows 100000 --out /tmp/flights.xlsx
+    cd backend && python -m benchmarks.synthetic --rows 1000000 --out /tmp/flights.csv
+
+Rows follow the column types in flight.sql and look like the real upload
+sheets: airline and airport codes, route keys built from them, passenger
+and seat counts that agree with each other, rates between 0 and 1 and money
+columns in millions. Rows are generated lazily, so 1M-row files are written
+without holding them in memory. Output is deterministic for a given --seed.
+"""
+import argparse
+import csv
+import random
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List
+
+from .common import parse_flight_sql
+
+AIRLINES = ["DL", "AA", "UA", "WN", "B6", "AS", "NK", "F9", "9E", "OO", "YX", "MQ"]
+HUBS = ["ATL", "DFW", "ORD", "DEN", "LAX", "JFK", "SEA", "MSP", "DTW", "CLT", "PHX", "IAH"]
+AIRPORTS = HUBS + ["BOS", "SFO", "LAS", "MCO", "MIA", "SAN", "TPA", "BNA", "AUS", "LHR", "CDG", "NRT", "MEX", "CUN"]
+INTERNATIONAL = {"LHR", "CDG", "NRT", "MEX", "CUN"}
+AIRCRAFT = {"A320": 150, "A321": 190, "B737": 160, "B738": 166, "B739": 180, "E175": 76, "CRJ9": 76, "B763": 211, "A333": 293}
+ENTITIES = ["Domestic", "Atlantic", "Pacific", "Latin"]
+SUB_REGIONS = ["North America", "Europe", "Asia", "Caribbean"]
+
+# Share of cells left empty, as in real sheets
+NULL_RATE = 0.02
+
+
+def _headers(columns: List[tuple]) -> List[str]:
+    # Spaced headers as users type them; services.clean_column_name maps them back
+    return [col.replace("_", " ") for col, *_ in columns]
+
+
+def flight_columns() -> List[tuple]:
+    return [c for c in parse_flight_sql()["flight_data"] if c[0] not in ("id", "File_Reference")]
+
+
+def _decimal(rng: random.Random, col: str, precision: str, scale: str) -> Decimal:
+    scale = int(scale)
+    limit = 10 ** (int(precision) - scale) - 1
+    name = col.lower()
+    if "rate" in name or "ratio" in name or "percentage" in name or name.startswith(("r2", "adj_factor")):
+        value = rng.random()
+    elif "prasm" in name or "per_" in name or "degree" in name or "intercept" in name:
+        value = rng.uniform(0, 50)
+    elif "mtow" in name:
+        value = rng.uniform(70000, 600000)
+    else:
+        value = rng.uniform(-5000, 2_000_000) if "true_up" in name or "tie" in name else rng.uniform(0, 2_000_000)
+    value = max(min(value, limit), -limit)
+    return Decimal(round(value, scale)).quantize(Decimal(1).scaleb(-scale))
+
+
+def iter_flight_rows(count: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """
+    Yield `count` flight_data rows (without id / File_Reference).
+    """
+    rng = random.Random(seed)
+    columns = flight_columns()
+    for _ in range(count):
+        airline = rng.choice(AIRLINES)
+        origin, destination = rng.sample(AIRPORTS, 2)
+        aircraft = rng.choice(list(AIRCRAFT))
+        departures = rng.randint(1, 400)
+        seats = AIRCRAFT[aircraft] * departures
+        passengers = int(seats * rng.uniform(0.55, 0.98))
+        miles = rng.randint(150, 6000)
+        known = {
+            "Quarter": f"Q{rng.randint(1, 4)}",
+            "Year": rng.randint(2019, 2025),
+            "Marketing_Airline": airline,
+            "Operating_Airline": airline if rng.random() < 0.8 else rng.choice(AIRLINES),
+            "Origin": origin,
+            "Destination": destination,
+            "Origin_Hub": origin if origin in HUBS else "",
+            "Destination_Hub": destination if destination in HUBS else "",
+            "Hub": origin if origin in HUBS else destination,
+            "Mkt_Op_One_Way_Airline_Route": f"{airline}{airline}{origin}{destination}",
+            "Mkt_One_Way_Airline_Route": f"{airline}{origin}{destination}",
+            "Non_Directional_Market": "".join(sorted((origin, destination))),
+            "Actual_Aircraft": aircraft,
+            "Proxy_Aircraft": aircraft,
+            "AC_Type": aircraft,
+            "Fleet_Type": "Regional" if AIRCRAFT[aircraft] < 100 else "Mainline",
+            "DOM_INT": "INT" if {origin, destination} & INTERNATIONAL else "DOM",
+            "Entity": rng.choice(ENTITIES),
+            "Sub_Region_B": rng.choice(SUB_REGIONS),
+            "ML_RL": "RL" if AIRCRAFT[aircraft] < 100 else "ML",
+            "CPA_or_WO": rng.choice(["CPA", "WO"]),
+            "Departures": departures,
+            "Miles": miles,
+            "ASMs": seats * miles,
+            "Seats": seats,
+            "Total_Passengers": passengers,
+            "Local_Passengers": int(passengers * rng.uniform(0.3, 0.9)),
+            "Flight_Minutes": departures * (miles // 8 + 20),
+            "Block_Minutes": departures * (miles // 8 + 40),
+            "Cargo_Pounds": rng.randint(0, 2_000_000),
+        }
+
+        row = {}
+        for col, col_type, precision, scale in columns:
+            if rng.random() < NULL_RATE:
+                row[col] = None
+            elif col in known:
+                row[col] = known[col]
+            elif col_type in ("int", "bigint"):
+                row[col] = rng.randint(0, 100000)
+            elif col_type == "decimal":
+                row[col] = _decimal(rng, col, precision, scale)
+            else:
+                row[col] = f"{col.split('_')[0].upper()}-{rng.randint(1, 40)}"
+        yield row
+
+
+def write_csv(path: str, count: int, seed: int = 0) -> str:
+    columns = flight_columns()
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(_headers(columns))
+        for row in iter_flight_rows(count, seed):
+            writer.writerow(["" if value is None else value for value in row.values()])
+    return path
+
+
+def write_workbook(path: str, count: int, seed: int = 0) -> str:
+    from openpyxl import Workbook
+
+    # write_only streams rows to disk instead of building the sheet in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("flight_data")
+    sheet.append(_headers(flight_columns()))
+    for row in iter_flight_rows(count, seed):
+        sheet.append([float(v) if isinstance(v, Decimal) else v for v in row.values()])
+    workbook.save(path)
+    return path
+
+
+WRITERS = {".xlsx": write_workbook, ".csv": write_csv}
+
+
+def write_file(path: str, count: int, seed: int = 0) -> str:
+    ext = path[path.rfind("."):].lower()
+    if ext not in WRITERS:
+        raise ValueError(f"Unsupported output format '{ext}', use one of {sorted(WRITERS)}")
+    return WRITERS[ext](path, count, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True, help="output path ending in .xlsx or .csv")
+    args = parser.parse_args()
+    print(write_file(args.out, args.rows, args.seed))
+
+
+if __name__ == "__main__":
+    main()
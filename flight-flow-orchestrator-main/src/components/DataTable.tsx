@@ -20,6 +20,7 @@ import { Skeleton } from "@/components/ui/skeleton";
 const ROWS_PER_PAGE = 10;
 
 const DataTable = ({ id, columnsToShow = [] }) => {
+  const projection = columnsToShow.join(",");
   const [fileName, setFileName] = useState("");
   const [records, setRecords] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -30,9 +31,10 @@ const DataTable = ({ id, columnsToShow = [] }) => {
       try {
         console.log(id)
         console.log("Cjheck Check is it able to Get ")
-        const response = await axios.get(`http://localhost:8000/filesv1/${id}`);
         const url = `http://localhost:8000/filesv1/${id}`;
       console.log("Making GET request to:", url);
+        // Only the shown columns are fetched when the caller names them
+        const response = await axios.get(url, { params: projection ? { columns: projection } : {} });
         setFileName(response.data.file.file_name);
         setRecords(response.data.records);
       } catch (error) {
@@ -43,7 +45,7 @@ const DataTable = ({ id, columnsToShow = [] }) => {
     };
 
     fetchData();
-  }, [id]);
+  }, [id, projection]);
 
   if (loading) {
     return (
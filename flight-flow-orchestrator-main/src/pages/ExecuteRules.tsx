@@ -492,7 +492,7 @@ const ExecuteRules = () => {
   id={currentFileReference} 
   columnsToShow={
     typeof selectedRuleDetails?.selcols === 'string'
-      ? [...selectedRuleDetails.selcols.split("||").filter(col => col.trim() !== ""), selectedRuleDetails?.tcolumn]
+      ? [...selectedRuleDetails.selcols.split("|").filter(col => col.trim() !== ""), selectedRuleDetails?.tcolumn]
       : selectedRuleDetails?.tcolumn
       ? [selectedRuleDetails.tcolumn]
       : []